@@ -0,0 +1,15 @@
+# -*- coding: UTF-8 -*-
+"""excel to json, `ProcessExcel` write the sheets of a workbook to json files, `iter_rows`
+yield the rows of a sheet in process without writing files and `headers` give the header
+of a sheet. They are imported from
+exceltojson.excel2json when they are first used, so the command line start fast
+"""
+
+__all__ = ['ProcessExcel', 'iter_rows', 'headers']
+
+
+def __getattr__(name):
+    if name in __all__:
+        from exceltojson import excel2json
+        return getattr(excel2json, name)
+    raise AttributeError('module {!r} has no attribute {!r}'.format(__name__, name))
@@ -0,0 +1,107 @@
+# -*- coding: UTF-8 -*-
+"""asyncio api, the workbook parse, row conversion and json writes run in a thread pool
+so the event loop is never blocked
+
+    report = await convert('book.xlsx', 'out')
+
+    async for row, data in aiter_rows('book.xlsx', sheet='Sheet1'):
+        ...
+"""
+from __future__ import unicode_literals
+
+import asyncio
+import threading
+
+# threads of the default executor, shared by all conversions of the process
+WORKERS = 4
+
+# rows converted ahead of the consumer of aiter_rows
+QUEUE_SIZE = 1000
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# put after the last row of aiter_rows
+_END = object()
+
+
+def default_executor():
+    """ the thread pool used when no executor is given, created on first use
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+
+            _executor = ThreadPoolExecutor(max_workers=WORKERS)
+    return _executor
+
+
+async def convert(excel_path, save_path, max_row=1000, max_bytes=None, executor=None, **options):
+    """ ProcessExcel(excel_path, save_path, **options)(max_row, max_bytes) in the executor.
+    If the awaiting task is cancelled the conversion stop before its next row, the json files
+    written so far are left, with worker processes the running sheets are finished first
+    :param executor: concurrent.futures executor, default_executor() if not given
+    :return: same as ProcessExcel.__call__
+    """
+    from exceltojson.excel2json import ProcessExcel
+
+    cancelled = threading.Event()
+
+    def run():
+        excel = ProcessExcel(excel_path, save_path, **options)
+        excel._cancelled = cancelled
+        return excel(max_row, max_bytes)
+
+    loop = asyncio.get_event_loop()
+    try:
+        return await loop.run_in_executor(executor or default_executor(), run)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+
+async def aiter_rows(excel_path, sheet=0, queue_size=QUEUE_SIZE, executor=None, **options):
+    """ async generator of iter_rows(excel_path, sheet, **options), the rows are converted in the
+    executor and handed over through a queue, the conversion wait once queue_size rows are not
+    taken yet. It stop when the generator is closed or its task is cancelled
+    :param queue_size: rows converted ahead of the consumer
+    :param executor: concurrent.futures executor, default_executor() if not given, a conversion
+           hold one of its threads until it is done
+    :return: same as iter_rows
+    """
+    from exceltojson.excel2json import iter_rows
+
+    loop = asyncio.get_event_loop()
+    queue = asyncio.Queue()
+    # the rows the converter may put before it wait for the consumer
+    slots = threading.Semaphore(queue_size)
+    stop = threading.Event()
+
+    def produce():
+        error = None
+        try:
+            for item in iter_rows(excel_path, sheet, **options):
+                slots.acquire()
+                if stop.is_set():
+                    return
+                loop.call_soon_threadsafe(queue.put_nowait, item)
+        except Exception as e:
+            error = e
+        if not stop.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, (_END, error))
+
+    loop.run_in_executor(executor or default_executor(), produce)
+    try:
+        while True:
+            item = await queue.get()
+            if item[0] is _END:
+                if item[1] is not None:
+                    raise item[1]
+                return
+            slots.release()
+            yield item
+    finally:
+        stop.set()
+        # wake the converter if it wait for a slot
+        slots.release()
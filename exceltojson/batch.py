@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+"""batch mode, convert all workbooks of a directory or a glob pattern with one pool of
+worker processes, the json files of a workbook go to a directory of the output tree
+which mirror the source tree
+"""
+from __future__ import unicode_literals
+
+import glob
+import json
+import os
+import time
+
+# workbook file suffixes found in a source directory
+SUFFIXES = ('.xls', '.xlsx')
+
+# the summary report written to the output directory
+REPORT_NAME = 'batch-report.json'
+
+
+def is_batch_source(source):
+    """ a directory or a glob pattern is a batch source, an existing file is not
+    """
+    return not os.path.isfile(source) and (os.path.isdir(source) or glob.has_magic(source))
+
+
+def find_workbooks(source):
+    """
+    :param source: a directory, all workbooks under it are found, or a glob pattern
+    :return: (root directory, sorted workbook paths), the paths are relative to the root
+    """
+    if os.path.isdir(source):
+        root = source
+        paths = [os.path.join(dir_path, name)
+                 for dir_path, dir_names, file_names in os.walk(source)
+                 for name in file_names
+                 if name.lower().endswith(SUFFIXES) and not name.startswith('~$')]
+    else:
+        paths = [path for path in glob.glob(source) if os.path.isfile(path)]
+        # the directory part before the first wildcard
+        root = os.path.dirname(source.split('*')[0].split('?')[0].split('[')[0]) or '.'
+    return root, sorted(os.path.relpath(path, root) for path in paths)
+
+
+def convert_batch(source, save_path, workers=1, max_row=1000, max_bytes=None, **options):
+    """ convert the workbooks, a bad workbook only fail its own entry of the report
+    :param source: a directory or a glob pattern
+    :param save_path: the output root directory, the json files of `a/b.xlsx` go to `a/b.xlsx/`,
+           the suffix is kept so `a/b.xls` does not write into the same directory
+    :param workers: worker processes shared by all workbooks, 1 convert them in this process
+    :param max_row: same as ProcessExcel.__call__
+    :param max_bytes: same as ProcessExcel.__call__
+    :param options: ProcessExcel keyword arguments, with stats=True the stats of a workbook are
+           the `stats` of its entry, see ConvertStats.as_dict
+    :return: the summary report dict, also written to save_path as batch-report.json
+    """
+    if not os.path.isdir(save_path):
+        raise ValueError('save path: {} not exist'.format(save_path))
+    try:
+        workers = int(workers)
+    except (TypeError, ValueError):
+        raise ValueError('workers should be a int value but you give {}'.format(workers))
+    if workers < 1:
+        raise ValueError('workers should not less than 1 but you give {}'.format(workers))
+
+    root, names = find_workbooks(source)
+    start = time.time()
+    tasks = [(os.path.join(root, name), os.path.join(save_path, name), max_row, max_bytes, options)
+             for name in names]
+    if workers == 1 or len(tasks) < 2:
+        files = [_convert_file(*task) for task in tasks]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=min(workers, len(tasks))) as executor:
+            futures = [executor.submit(_convert_file, *task) for task in tasks]
+            files = [_result(future) for future in futures]
+    for name, entry in zip(names, files):
+        entry['source'] = name
+
+    report = {
+        'source': source,
+        'files': files,
+        'converted': sum(1 for entry in files if entry['status'] == 'ok'),
+        'failed': sum(1 for entry in files if entry['status'] != 'ok'),
+        'rows': sum(entry['rows'] for entry in files),
+        'bytes': sum(entry['bytes'] for entry in files),
+        'seconds': time.time() - start,
+    }
+    with open(os.path.join(save_path, REPORT_NAME), 'w') as f:
+        f.write(json.dumps(report, indent=2))
+    return report
+
+
+def _result(future):
+    """ the entry of a worker task, a dead worker process fail the entry too
+    """
+    try:
+        return future.result()
+    except Exception as e:
+        return _entry('error', 0, error='{}: {}'.format(type(e).__name__, e))
+
+
+def _entry(status, seconds, rows=0, size=0, sheets=0, skipped=0, error=None, stats=None):
+    return {'status': status, 'rows': rows, 'bytes': size, 'sheets': sheets, 'skipped': skipped,
+            'seconds': seconds, 'error': error, 'stats': stats}
+
+
+def _convert_file(excel_path, save_path, max_row, max_bytes, options):
+    """ worker task, convert one workbook into its own output directory
+    :return: the report entry of the workbook
+    """
+    from exceltojson.excel2json import ProcessExcel
+
+    start = time.time()
+    try:
+        if not os.path.isdir(save_path):
+            os.makedirs(save_path)
+        report = ProcessExcel(excel_path, save_path, **options)(max_row, max_bytes)
+    except Exception as e:
+        return _entry('error', time.time() - start, error=str(e))
+    stats = report['stats'].as_dict() if report['stats'] is not None else None
+    return _entry('ok', time.time() - start, report['rows'], report['bytes'],
+                  len(report['converted']), len(report['skipped']), stats=stats)
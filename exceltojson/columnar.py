@@ -0,0 +1,173 @@
+# -*- coding: UTF-8 -*-
+"""numpy engine, the data rows of a sheet are converted column by column in
+batches of rows instead of cell by cell, the rows and json are the same as the
+row engine. The text of a column is built by cell type with map, numpy finds the
+empty rows and does the merge cell fill. It needs numpy.
+"""
+from __future__ import unicode_literals
+
+from itertools import compress, repeat
+
+from six.moves import range as _range
+from xlrd import XL_CELL_DATE, XL_CELL_TEXT, XL_CELL_EMPTY, XL_CELL_BLANK
+
+from exceltojson.excel2json import _sheet_rows, _ForwardFill, _date_converter, MAX_CELL_LENGTH
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# rows converted together, bound the memory of a batch
+BATCH_ROWS = 65536
+
+# cell types of a column whose text is built without a python loop
+_DATE_KINDS = {XL_CELL_DATE, XL_CELL_EMPTY, XL_CELL_BLANK}
+_TEXT_KINDS = {XL_CELL_TEXT, XL_CELL_EMPTY, XL_CELL_BLANK}
+
+
+def columnar_rows(sheet_process, batch_rows=BATCH_ROWS):
+    """ generator, same as _SheetProcess.__call__ with the row engine
+    :param sheet_process: _SheetProcess, the header and data region is already found
+    :param batch_rows: rows converted together
+    :return: (row number, dict value), dict value is None for empty row if not merge cell
+    """
+    if np is None:
+        raise ValueError('numpy engine need numpy installed')
+    keys = sheet_process.headers
+    sheet = sheet_process.sheet
+    first_row = sheet_process.start_row+1
+    columns = _range(sheet_process.start_col, sheet_process.start_col+len(keys))
+    if hasattr(sheet, 'iter_rows'):
+        # stream sheet can only be read row by row
+        batches = _batches(_sheet_rows(sheet, first_row, columns[0], columns[-1]+1), batch_rows)
+    else:
+        batches = _column_batches(sheet, first_row, columns, batch_rows)
+
+    # merged ranges are filled row by row, blank cells without merged ranges column by column
+    range_fill = None
+    if sheet_process.merge_cell:
+        range_fill = sheet_process.merge_fill()
+        if isinstance(range_fill, _ForwardFill):
+            range_fill = None
+
+    # merge cell carry the last non-empty value of each column to the next batch
+    last = [''] * len(keys)
+    stats = sheet_process.stats
+    convert_date = _date_converter(sheet_process.date_mode, sheet_process.date_format)
+    for start, values, types in batches:
+        if stats is not None:
+            stats.date_cells += sum(column.count(XL_CELL_DATE) for column in types)
+        text = [_convert(column, column_types, convert_date) for column, column_types in zip(values, types)]
+        non_empty = _non_empty(text)
+        filled = non_empty.any(axis=0)
+        numbers = _range(start + 1, start + 1 + len(filled))
+        if sheet_process.merge_cell and not filled.all():
+            # empty rows are dropped before the fill
+            keep = filled.tolist()
+            numbers = list(compress(numbers, keep))
+            text = [list(compress(column, keep)) for column in text]
+            non_empty = non_empty[:, filled]
+        if range_fill is not None:
+            for number, row in zip(numbers, zip(*text)):
+                yield number, dict(zip(keys, range_fill(number - 1, list(row))))
+        elif sheet_process.merge_cell:
+            text = [_fill_column(column, column_non_empty, last[i]) if not column_non_empty.all() else column
+                    for i, (column, column_non_empty) in enumerate(zip(text, non_empty))]
+            if len(numbers):
+                last = [column[-1] for column in text]
+            yield from zip(numbers, _dicts(keys, text))
+        elif filled.all():
+            yield from zip(numbers, _dicts(keys, text))
+        else:
+            for number, is_filled, row in zip(numbers, filled.tolist(), zip(*text)):
+                yield number, dict(zip(keys, row)) if is_filled else None
+
+
+def _dicts(keys, text):
+    """ the row dicts of the columns, built without a python loop
+    :param text: text lists of the columns
+    :return: iterator of dict
+    """
+    return map(dict, map(zip, repeat(keys), zip(*text)))
+
+
+def _column_batches(sheet, first_row, columns, batch_rows):
+    """ read the data region column by column
+    :param sheet: xlrd sheet
+    :param first_row: first data row index
+    :param columns: data column indexes
+    :return: iterator of (first row index, column value lists, column type lists)
+    """
+    for start in _range(first_row, sheet.nrows, batch_rows):
+        end = min(start + batch_rows, sheet.nrows)
+        yield (start, [sheet.col_values(colx, start, end) for colx in columns],
+               [sheet.col_types(colx, start, end) for colx in columns])
+
+
+def _batches(rows, batch_rows):
+    """ group rows to columns, the rows are consecutive
+    :param rows: iterator of (row index, values, types)
+    :return: iterator of (first row index, column value lists, column type lists)
+    """
+    start, values, types = None, [], []
+    for index, row_values, row_types in rows:
+        if start is None:
+            start = index
+        values.append(row_values)
+        types.append(row_types)
+        if len(values) >= batch_rows:
+            yield start, [list(column) for column in zip(*values)], [list(column) for column in zip(*types)]
+            start, values, types = None, [], []
+    if values:
+        yield start, [list(column) for column in zip(*values)], [list(column) for column in zip(*types)]
+
+
+def _convert(values, types, convert_date):
+    """ cell text of a column of a batch, a column is mostly of one cell type so the
+    text is built by type with map instead of cell by cell
+    :param convert_date: date cell value to text
+    :return: text list
+    """
+    kinds = set(types)
+    if XL_CELL_DATE in kinds:
+        if kinds <= _DATE_KINDS:
+            # each distinct day is converted once, the empty cells are ''
+            texts = {value: convert_date(value) for value in set(values) if value != ''}
+            texts[''] = ''
+            return list(map(texts.__getitem__, values))
+        return [convert_date(value) if ctype == XL_CELL_DATE else str(value).strip()
+                for value, ctype in zip(values, types)]
+    if kinds <= _TEXT_KINDS:
+        return list(map(str.strip, values))
+    if XL_CELL_TEXT not in kinds:
+        # numbers, booleans and errors have no blanks around them
+        return list(map(str, values))
+    return [str(value).strip() for value in values]
+
+
+def _non_empty(text):
+    """
+    :param text: text lists of the columns of a batch
+    :return: 2d bool, column by row, the cell is not empty
+    """
+    lengths = np.array([np.fromiter(map(len, column), dtype=np.intp, count=len(column)) for column in text])
+    # 添加值验证
+    if lengths.size and lengths.max() > MAX_CELL_LENGTH:
+        raise ValueError('Cell value too large')
+    return lengths > 0
+
+
+def _fill_column(column, non_empty, last):
+    """ _ForwardFill of a column of a batch, an empty cell take the last non-empty
+    value above it
+    :param column: text list of the column, the empty rows are dropped
+    :param non_empty: bool array, cell is not empty
+    :param last: the value carried from the rows before this batch
+    :return: filled text list
+    """
+    source = np.where(non_empty, np.arange(len(column)), -1)
+    np.maximum.accumulate(source, out=source)
+    # the cells before the first non-empty one take the value carried
+    filled = np.array([last] + list(column), dtype=object)[source + 1]
+    return filled.tolist()
@@ -1,8 +1,12 @@
+from __future__ import print_function
+
+import errno
+import os
 import sys
 import getopt
 
-
-from exceltojson.excel2json import ProcessExcel
+# the conversion modules are imported when a conversion start, so -h and argument errors
+# do not wait for xlrd
 
 # __all__ = ['ProcessExcel', 'main', 'usage']
 
@@ -11,11 +15,37 @@ def usage():
     print("""
 -h | --help: get help document
 -S | --notShowRow: line number to key
--s | --sourcePath: excel file path
--o | --outDir: json file save dir
+-s | --sourcePath: excel file path, - read the excel file from stdin, a directory or a glob pattern
+                   like "in/*.xlsx" convert all the workbooks in batch into a mirror tree of outDir,
+                   -j worker processes are shared by all workbooks, a batch-report.json is written,
+                   the json files of a/b.xlsx go to the a/b.xlsx directory of outDir
+-o | --outDir: json file save dir, - write the rows to stdout, it need a single sheet or ndjson format,
+               the ndjson rows of more sheets have the sheet name as the "_sheet" field, so -S is not allowed
 -P | --noPatchAlias: usr header alias, if no alias use column header as the key.
--M | --noMergeCell: if empty cell, use as merge cell, the content will be same with above cell.
+-M | --noMergeCell: keep empty cells empty. Without it, in a xlsx sheet with merged ranges the empty cells
+                    inside a range take the value of the range and the empty cells outside stay empty,
+                    in a .xls file or a sheet without merged ranges each empty cell take the cell value above.
 -r | --rowMax:  default 1000, type int, to use this limit json file size
+-B | --maxBytes: type int, a json file should not be larger than this many bytes, with it
+                 -r is not limited to 1000000 and is not limited at all if not given
+-f | --format: default json, json write a json object or array to each file,
+               ndjson write one row for each line, the row number is the "_row" field
+-I | --incremental: skip the sheets not changed since the last run into the same output dir,
+                    the fingerprints of the sheets are kept in a state file of the output dir
+-T | --stats: print the time of each stage and the rows, cells, bytes, chunks and date cells of each sheet,
+              in batch for each workbook, they are also kept in batch-report.json
+-p | --profile: run the conversion under cProfile and dump the profile to this file,
+                read it with python -m pstats
+-W | --backgroundWrite: write the json files in a writer thread while the next rows are converted
+--fsync: fsync each json file before it replace the old one, json files are always written to
+         a temp file first so a reader never see a part of a file
+-D | --dateFormat: default %Y/%m/%d, strftime format of the date cells, eg: -D %Y-%m-%d
+-j | --jobs: default 1, type int, convert sheets in parallel with this many worker processes
+-G | --rangeRows: type int, with -j split each sheet into ranges of this many rows which the worker
+                  processes convert, for workbooks with one large sheet, only with the xlrd reader,
+                  the workers are spawned and parse the sheet again with -W or on macOS
+-R | --reader: default xlrd, xlrd parse a whole sheet in memory (file size limit 100MB),
+               stream read xlsx sheets row by row with bounded memory and no file size limit
 -i | --index: sheet index list , eg: -i 0, 1, 2
 -n | --names: sheet name list, eg: -n name1,name2,name3
 -a | --alias: change column header name and as this key word, eg: -a header1:alias1,header2:alias2;otherHeader:otherAlias
@@ -28,8 +58,9 @@ def main():
     try:
         opts, args = getopt.getopt(
             sys.argv[1:],
-            "hMPr:a:i:n:o:s:S",
-            ["help", "rowMax", "noMergeCell", "noPatchAlias",
+            "hMPITWr:B:f:p:D:j:G:R:a:i:n:o:s:S",
+            ["help", "rowMax", "maxBytes=", "format=", "incremental", "stats", "profile=", "backgroundWrite", "fsync",
+             "dateFormat=", "jobs=", "rangeRows=", "reader=", "noMergeCell", "noPatchAlias",
              "alias", "index", "names", "outDir", "sourcePath", "noShowRow"])
     except getopt.GetoptError as e:
         print(str(e))
@@ -39,6 +70,18 @@ def main():
     excel_path = ''
     output_dir = ''
     row_max = 1000
+    row_max_given = False
+    max_bytes = None
+    jobs = 1
+    range_rows = None
+    date_format = '%Y/%m/%d'
+    reader = 'xlrd'
+    output_format = 'json'
+    incremental = False
+    stats = False
+    profile = None
+    background_write = False
+    fsync = False
     merge_cell = True
     patch_alias = True
     show_row = True
@@ -66,6 +109,41 @@ def main():
             except ValueError:
                 print('-r, --rowMax should be a integer value')
                 sys.exit(-1)
+            row_max_given = True
+        elif o in ('-B', '--maxBytes'):
+            try:
+                max_bytes = int(a)
+            except ValueError:
+                print('-B, --maxBytes should be a integer value')
+                sys.exit(-1)
+        elif o in ('-j', '--jobs'):
+            try:
+                jobs = int(a)
+            except ValueError:
+                print('-j, --jobs should be a integer value')
+                sys.exit(-1)
+        elif o in ('-D', '--dateFormat'):
+            date_format = a
+        elif o in ('-G', '--rangeRows'):
+            try:
+                range_rows = int(a)
+            except ValueError:
+                print('-G, --rangeRows should be a integer value')
+                sys.exit(-1)
+        elif o in ('-I', '--incremental'):
+            incremental = True
+        elif o in ('-W', '--backgroundWrite'):
+            background_write = True
+        elif o == '--fsync':
+            fsync = True
+        elif o in ('-T', '--stats'):
+            stats = True
+        elif o in ('-p', '--profile'):
+            profile = a
+        elif o in ('-f', '--format'):
+            output_format = a
+        elif o in ('-R', '--reader'):
+            reader = a
         elif o in ('-i', '--index'):
             temp = a.split(',')
             try:
@@ -120,20 +198,98 @@ def main():
         print(alias_desc)
         sys.exit(-1)
 
+    # split by size only if the row count is not asked for too
+    if max_bytes is not None and not row_max_given:
+        row_max = None
+
+    # read the whole workbook once, xlrd need all of it
+    file_contents = None
+    if excel_path == '-':
+        file_contents = getattr(sys.stdin, 'buffer', sys.stdin).read()
+
     def get_pairs(_list):
         return {key: value for key, value in zip(_list, alias)}
 
+    from exceltojson.batch import is_batch_source
+
+    if excel_path != '-' and is_batch_source(excel_path):
+        _profiled(profile, _batch, excel_path, output_dir, jobs, row_max, max_bytes, merge_cell=merge_cell,
+                  show_row=show_row, patch_sheet_alias=patch_alias, index_sheets=get_pairs(index) if index else None,
+                  name_sheets=get_pairs(names) if names else None, reader=reader, output_format=output_format,
+                  incremental=incremental, stats=stats, background_write=background_write, fsync=fsync,
+                  range_rows=range_rows, date_format=date_format)
+        return
+
+    from exceltojson.excel2json import ProcessExcel
+
+    options = dict(workers=jobs, reader=reader, output_format=output_format, file_contents=file_contents,
+                   incremental=incremental, stats=stats, background_write=background_write, fsync=fsync,
+                   range_rows=range_rows, date_format=date_format)
+    # keep stdout for the rows
+    message_file = sys.stderr if output_dir == '-' else sys.stdout
     try:
         if index:
             pairs = get_pairs(index)
-            ProcessExcel(excel_path, output_dir, pairs, None, merge_cell, show_row, patch_alias)(row_max)
+            excel = ProcessExcel(excel_path, output_dir, pairs, None, merge_cell, show_row, patch_alias, **options)
         elif names:
             pairs = get_pairs(names)
-            ProcessExcel(excel_path, output_dir, None, pairs, merge_cell, show_row, patch_alias)(row_max)
+            excel = ProcessExcel(excel_path, output_dir, None, pairs, merge_cell, show_row, patch_alias, **options)
         else:
-            ProcessExcel(excel_path, output_dir, None, None, merge_cell, show_row, patch_alias)(row_max)
+            excel = ProcessExcel(excel_path, output_dir, None, None, merge_cell, show_row, patch_alias, **options)
+        report = _profiled(profile, excel, row_max, max_bytes)
+    except ValueError as e:
+        print(str(e), file=message_file)
+        return
+    except IOError as e:
+        # the reader of stdout is gone, e.g. `| head`
+        if output_dir != '-' or e.errno != errno.EPIPE:
+            raise
+        # python flush stdout at exit, point it at devnull so that does not fail again
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+    if incremental:
+        print('{} sheets converted, {} unchanged sheets skipped'.format(
+            len(report['converted']), len(report['skipped'])), file=message_file)
+    if stats:
+        print(report['stats'].format(), file=message_file)
+
+
+def _profiled(profile, func, *args, **kwargs):
+    """ call func, under cProfile if a profile file is given, the profile is dumped even if func fail
+    """
+    if not profile:
+        return func(*args, **kwargs)
+    import cProfile
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        profiler.dump_stats(profile)
+
+
+def _batch(source, output_dir, jobs, row_max, max_bytes, **options):
+    from exceltojson.batch import convert_batch
+
+    try:
+        report = convert_batch(source, output_dir, jobs, row_max, max_bytes, **options)
     except ValueError as e:
         print(str(e))
+        sys.exit(-1)
+    for entry in report['files']:
+        if entry['status'] != 'ok':
+            print('{}: {}'.format(entry['source'], entry['error']))
+        elif entry['stats'] is not None:
+            from exceltojson.stats import ConvertStats
+
+            print('{}:'.format(entry['source']))
+            print(ConvertStats.from_dict(entry['stats']).format())
+    print('{} workbooks converted, {} failed, {} rows, {} bytes, {:.1f}s'.format(
+        report['converted'], report['failed'], report['rows'], report['bytes'], report['seconds']))
+    if report['failed']:
+        sys.exit(1)
 
 # if __name__ == '__main__':
 #     main()
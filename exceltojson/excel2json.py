@@ -8,27 +8,37 @@
 """
 from __future__ import unicode_literals
 import json
+import hashlib
+import threading
+import time
+import weakref
+from functools import lru_cache
 from xlrd.xldate import xldate_as_datetime
-from xlrd import XL_CELL_DATE
-from six import itervalues
+from xlrd import XL_CELL_DATE, XL_CELL_EMPTY, XL_CELL_BLANK, XL_CELL_TEXT
 from six.moves import range as _range
 from six import PY2
-from exceltojson.utils import get_sheets, get_sheet_names
+from exceltojson.utils import get_sheets, get_reader, Workbook, WorkbookCache
 
 import os
 import sys
 
-# 添加最大文件大小限制（100MB）
-MAX_FILE_SIZE = 100 * 1024 * 1024
+# 添加最大文件大小限制（100MB），这是 xlrd reader 的限制，每个 reader 有自己的 MAX_FILE_SIZE
+MAX_FILE_SIZE = Workbook.MAX_FILE_SIZE
 
-def check_file_size(file_path):
-    """检查文件大小是否超过限制"""
-    if os.path.getsize(file_path) > MAX_FILE_SIZE:
-        raise ValueError(f'File size exceeds maximum limit of {MAX_FILE_SIZE/1024/1024}MB')
+def check_file_size(file_path, max_size=MAX_FILE_SIZE, file_contents=None):
+    """检查文件大小是否超过限制, max_size 为 None 时不限制, 给出 file_contents 时检查内容的大小"""
+    if max_size is None:
+        return
+    size = os.path.getsize(file_path) if file_contents is None else len(file_contents)
+    if size > max_size:
+        raise ValueError(f'File size exceeds maximum limit of {max_size/1024/1024}MB')
+
+# 限制单个单元格最大长度
+MAX_CELL_LENGTH = 1000000
 
 def validate_cell_value(value):
     """验证单元格值是否安全"""
-    if isinstance(value, str) and len(value) > 1000000:  # 限制单个单元格最大长度
+    if isinstance(value, str) and len(value) > MAX_CELL_LENGTH:
         raise ValueError('Cell value too large')
     return value
 
@@ -57,48 +67,241 @@ else:
         return codecs.open(filename=file, mode=mode, encoding=encoding, errors=errors, buffering=buffering)
 
 
+# date cell text format
+DATE_FORMAT = '%Y/%m/%d'
+
+# date cell texts kept for each date mode and format, date columns repeat a few hundred days
+DATE_CACHE_SIZE = 4096
+
+# (date mode, date format): memoized conversion
+_date_converters = {}
+
+
+def _date_converter(date_mode, date_format=DATE_FORMAT):
+    """ the date cell conversion of a date mode and format, shared by all sheets, least
+    recently used texts are dropped, its cache_info() tell the hits and misses
+    :return: function, date cell value to text
+    """
+    key = (date_mode, date_format)
+    converter = _date_converters.get(key)
+    if converter is None:
+        def convert(value):
+            return xldate_as_datetime(value, date_mode).strftime(date_format)
+        converter = _date_converters.setdefault(key, lru_cache(maxsize=DATE_CACHE_SIZE)(convert))
+    return converter
+
+
 class _RowProcess(object):
-    """a row treat like an object, and empty row will
+    """a row treat like an object, and empty row will be None. Build it once
+    per sheet and call it for every row index
     """
 
-    def __init__(self, sheet, keys, col_index):
+    __slots__ = ('sheet', 'keys', 'col', 'end_col', 'date_mode', '_convert_date')
+
+    def __init__(self, sheet, keys, col_index, date_mode=None, date_format=DATE_FORMAT):
         self.sheet = sheet
 
-        # Each column corresponds to the key, it should be a list type
-        self.keys = keys
+        # Each column corresponds to the key
+        self.keys = tuple(keys)
 
         # The start column to use
         self.col = col_index
 
-        self.date_mode = int(os.environ['date_mode']) or 0
+        # The row content lies in the column slice [col, end_col)
+        self.end_col = col_index + len(keys)
+
+        # 0: 1900-based, 1: 1904-based, the workbook of the sheet tells it if not given
+        self.date_mode = sheet.book.datemode if date_mode is None else date_mode
+
+        self._convert_date = _date_converter(self.date_mode, date_format)
 
     def __call__(self, row):
         """ give a row index return a dict value
         :param row: row index tell which row now process
         :return: dict value
         """
+        return self.convert(self.sheet.row_values(row, self.col, self.end_col),
+                            self.sheet.row_types(row, self.col, self.end_col))
 
-        row_dict = {}
-        for index, key in enumerate(self.keys):
-            cell = self.sheet.row(row)[self.col+index]
-            if cell.ctype is XL_CELL_DATE:
-                row_dict[key] = xldate_as_datetime(cell.value, self.date_mode).strftime('%Y/%m/%d')
-            else:
-                # 添加值验证
-                row_dict[key] = validate_cell_value(str(cell.value).strip())
-        if self._check_state(row_dict):
+    def convert(self, values, types):
+        """ give the row cell values and types return a dict value
+        :param values: cell values of the column slice [col, end_col)
+        :param types: cell types of the column slice [col, end_col)
+        :return: dict value, None for empty row
+        """
+        values = self.texts(values, types)
+        if not any(values):
             return
-        return row_dict
+        return dict(zip(self.keys, values))
 
-    def _check_state(self, row_dict):
-        """ check whether the row is empty
-        :param row_dict:
-        :return: empty row return true
+    def texts(self, values, types):
+        """ same as convert, but return the cell text list
         """
-        for val in itervalues(row_dict):
-            if val:
-                return
-        return True
+        if XL_CELL_DATE in types:
+            return [self._convert_date(value) if ctype == XL_CELL_DATE else _convert_text(value)
+                    for value, ctype in zip(values, types)]
+        return [_convert_text(value) for value in values]
+
+
+def _convert_text(value):
+    # 添加值验证
+    return validate_cell_value(str(value).strip())
+
+
+class _ForwardFill(object):
+    """merge cell stage when the sheet has no merged ranges, an empty cell take the
+    last non-empty value above it, only that value is kept for each column
+    """
+
+    __slots__ = ('last',)
+
+    def __init__(self, width):
+        self.last = [''] * width
+
+    def __call__(self, row_index, values):
+        """ fill the row cell text list
+        :return: the filled list, it is kept as the last row so do not change it
+        """
+        if not all(values):
+            values = [value or last for value, last in zip(values, self.last)]
+        self.last = values
+        return values
+
+
+class _MergedRangeFill(object):
+    """merge cell stage using the sheet merged ranges, an empty cell in a merged range
+    take the text of the range top left cell, which is seen first as rows come in order,
+    empty cells out of merged ranges stay empty
+    """
+
+    __slots__ = ('starts', 'covers', 'texts', 'ends', 'first_row')
+
+    def __init__(self, merged_cells, first_row, start_col, width):
+        """
+        :param merged_cells: xlrd merged ranges, (first row, last row+1, first col, last col+1)
+        :param first_row: first data row index
+        :param start_col: first data column index
+        :param width: data column count
+        """
+        # row index: [(range, top left column offset)], ranges starting at the row
+        self.starts = {}
+        # row index: [(column offset, range)], merged cells other than the top left one
+        self.covers = {}
+        # range: top left text
+        self.texts = {}
+        # range: last row index + 1
+        self.ends = {}
+        self.first_row = first_row
+        end_col = start_col + width
+        for n, (rlo, rhi, clo, chi) in enumerate(merged_cells):
+            if max(clo, start_col) >= min(chi, end_col) or rhi <= first_row:
+                continue
+            self.starts.setdefault(rlo, []).append((n, clo - start_col))
+            self.ends[n] = rhi
+            for rowx in _range(max(rlo, first_row), rhi):
+                for colx in _range(max(clo, start_col), min(chi, end_col)):
+                    if (rowx, colx) != (rlo, clo):
+                        self.covers.setdefault(rowx, []).append((colx - start_col, n))
+
+    def __call__(self, row_index, values):
+        """ fill the row cell text list in place
+        :return: values
+        """
+        for n, offset in self.starts.get(row_index, ()):
+            # a top left cell left of the table is not part of the row
+            self.texts[n] = values[offset] if offset >= 0 else ''
+        for offset, n in self.covers.get(row_index, ()):
+            if not values[offset]:
+                values[offset] = self.texts.get(n, '')
+        return values
+
+    def seed(self, row_index, row_texts):
+        """ start the fill at row_index instead of the first data row, the top left text of
+        the ranges across it is read with row_texts
+        :param row_texts: function, row index to the row cell text list
+        """
+        for rlo, starts in self.starts.items():
+            # a top left cell above the data rows is never seen
+            if not self.first_row <= rlo < row_index:
+                continue
+            for n, offset in starts:
+                if self.ends[n] > row_index:
+                    self.texts[n] = row_texts(rlo)[offset] if offset >= 0 else ''
+
+
+def _sheet_rows(sheet, start_row, start_col, end_col):
+    """ rows of a sheet from start_row, a stream sheet read them itself
+    :return: iterator of (row index, values, types), values and types are the cells
+             of the column slice [start_col, end_col)
+    """
+    iter_rows = getattr(sheet, 'iter_rows', None)
+    if iter_rows is not None:
+        return iter_rows(start_row, start_col, end_col)
+    return ((row, sheet.row_values(row, start_col, end_col), sheet.row_types(row, start_col, end_col))
+            for row in _range(start_row, sheet.nrows))
+
+
+def _first_filled(values, types):
+    """ index of the first non-empty cell of a row, a text cell of blanks is empty
+    :return: column index, None if all cells are empty
+    """
+    # XL_CELL_EMPTY is 0, a row of empty cells is passed over without a python loop
+    if not any(types):
+        return None
+    for colx, ctype in enumerate(types):
+        if ctype == XL_CELL_EMPTY or ctype == XL_CELL_BLANK:
+            continue
+        if ctype != XL_CELL_TEXT or values[colx].strip():
+            return colx
+    return None
+
+
+class _HeaderLocator(object):
+    """find the table header of a sheet, the first non-empty row and its first non-empty
+    column. A row is read in one go with row_types and row_values and the sheet row
+    length tells where it ends, the location is cached for each sheet
+    """
+
+    # 表头位置缓存, sheet: {(max_rows, max_cols): (row index, column index)}
+    _cache = weakref.WeakKeyDictionary()
+
+    def __init__(self, sheet, max_rows=500, max_cols=1000):
+        """
+        :param sheet: xlrd sheet or stream sheet
+        :param max_rows: rows to scan for the header row, None to scan the whole sheet
+        :param max_cols: the header should start before this column, None for no limit
+        """
+        self.sheet = sheet
+        self.max_rows = max_rows
+        self.max_cols = max_cols
+
+    def __call__(self):
+        """
+        :return: header row index, header start column index
+        """
+        located = self._cache.setdefault(self.sheet, {})
+        key = (self.max_rows, self.max_cols)
+        if key not in located:
+            located[key] = self._locate()
+        return located[key]
+
+    def _locate(self):
+        sheet = self.sheet
+        rowx = 0
+        while self.max_rows is None or rowx < self.max_rows:
+            try:
+                length = sheet.row_len(rowx)
+            except IndexError:
+                raise ValueError('exist empty sheet, please check')
+            colx = _first_filled(sheet.row_values(rowx, 0, length), sheet.row_types(rowx, 0, length)) \
+                if length else None
+            if colx is not None:
+                if self.max_cols is not None and colx >= self.max_cols:
+                    raise ValueError('scan {} columns with row {}, but not found header'.format(
+                        self.max_cols, rowx))
+                return rowx, colx
+            rowx += 1
+        raise ValueError('scan {} rows but not find the content header'.format(self.max_rows))
 
 
 class _ColProcess(object):
@@ -108,39 +311,49 @@ class _ColProcess(object):
     # scan to max column to find header
     MAX = 1000
 
-    def __init__(self, sheet, alias, header_index):
+    def __init__(self, sheet, alias, header_index, start_col=None, max_cols=MAX):
+        """
+        :param header_index: row index which should be the header row
+        :param start_col: header start column index, found in the header row if not given
+        :param max_cols: the header should start before this column, None for no limit
+        """
         self.sheet = sheet
         # change the header if don't want header to be a json key
         self.alias = alias
         # row index which should be the header row
         self.header_index = header_index
+        self.max_cols = max_cols
+        # the header row is padded to the sheet width like the data rows
+        try:
+            self.values = sheet.row_values(header_index)
+            self.types = sheet.row_types(header_index)
+        except IndexError:
+            raise ValueError('header_index: {} row is an empty row'.format(header_index))
         # find header column index
-        self._header_start_col()
+        if start_col is None:
+            self._header_start_col()
+        else:
+            self.start_col = start_col
 
     def _header_start_col(self):
         """find the header row corresponding column index
         """
-        self.start_col = self.MAX+1
-        try:
-            for i in _range(self.MAX):
-                if self.sheet.row(self.header_index)[i].value.strip():
-                    self.start_col = i
-                    break
-        except IndexError:
+        self.start_col = _first_filled(self.values, self.types)
+        if self.start_col is None:
             raise ValueError('header_index: {} row is an empty row'.format(self.header_index))
-        if self.start_col >= self.MAX + 1:
-            raise ValueError('scan {} columns with row {}, but not found header'.format(self.MAX),
-                             self.header_index)
+        if self.max_cols is not None and self.start_col >= self.max_cols:
+            raise ValueError('scan {} columns with row {}, but not found header'.format(
+                self.max_cols, self.header_index))
 
     def __call__(self):
         """ get json keys
         :return: header start column, json keys
         """
         col_list = []
-        row = self.sheet.row(self.header_index)
-        row_length = len(row)
-        for i in _range(self.start_col, row_length):
-            key = row[i].value.strip()
+        row_length = len(self.values)
+        for value, ctype in zip(self.values[self.start_col:], self.types[self.start_col:]):
+            # a number header is a key as its text
+            key = value.strip() if ctype == XL_CELL_TEXT else _convert_text(value)
             if key:
                 alias_key = self.alias.pop(key, None) or key
                 col_list.append(alias_key)
@@ -161,71 +374,97 @@ class _SheetProcess(object):
     # max scan rows to find the content header
     MAX = 500
 
-    def __init__(self, sheet, alias=None, merge_cell=True):
+    # 'row' convert the sheet row by row, 'numpy' convert batches of rows column by column
+    ENGINES = ('row', 'numpy')
+
+    def __init__(self, sheet, alias=None, merge_cell=True, date_mode=None, engine='row',
+                 scan_rows=MAX, scan_cols=_ColProcess.MAX, stats=None, date_format=DATE_FORMAT):
+        """
+        :param scan_rows: rows to scan for the header row, None to scan the whole sheet
+        :param scan_cols: the header should start before this column, None for no limit
+        :param stats: SheetStats, the row stages are timed into it if given
+        :param date_format: strftime format of the date cells
+        """
+        self.stats = stats
+        if engine not in self.ENGINES:
+            raise ValueError('engine should be one of {} but you give {}'.format(self.ENGINES, engine))
+        self.engine = engine
         self.alias = alias or {}
         self.sheet = sheet
-        self._fetch_start_row()
+        self.date_mode = sheet.book.datemode if date_mode is None else date_mode
+        self.date_format = date_format
+        self.start_row, self.start_col = _HeaderLocator(sheet, scan_rows, scan_cols)()
         # is a header list
-        self.headers = self._fetch_header_and_start_col()
+        self.headers = self._fetch_header()
         self.merge_cell = merge_cell
+        # one row converter serve all rows of the sheet
+        self.row_process = _RowProcess(sheet, self.headers, self.start_col, self.date_mode, date_format)
 
-    def _fetch_start_row(self):
-        """find start row which should be a table header
-        :return:
-        """
-        self.start_row = self.MAX+1
-        try:
-            for i in _range(self.MAX):
-                row = self.sheet.row(i)
-                for j in _range(len(row)):
-                    if row[j].value.strip():
-                        self.start_row = i
-                        return
-        except IndexError:
-            raise ValueError('exist empty sheet, please check')
-        if self.start_row >= self.MAX+1:
-            raise ValueError('scan {} rows but not find the content header'.format(self.MAX))
-
-    def _fetch_header_and_start_col(self):
+    def _fetch_header(self):
         """
         :return: get header list to become a json keys
         """
-        self.start_col, headers = _ColProcess(self.sheet, self.alias, self.start_row)()
-        return headers
+        # _ColProcess consume the alias, keep self.alias as it was given
+        return _ColProcess(self.sheet, dict(self.alias), self.start_row, self.start_col)()[1]
+
+    def merge_fill(self):
+        """ merge cell stage of the sheet, the sheet merged ranges are honoured if the
+        reader provide them, otherwise every empty cell take the value above it
+        """
+        merged_cells = getattr(self.sheet, 'merged_cells', None)
+        if merged_cells:
+            return _MergedRangeFill(merged_cells, self.start_row+1, self.start_col, len(self.headers))
+        return _ForwardFill(len(self.headers))
 
     def __call__(self):
         """ generator, each one should be a row index number and corresponding dict content, the dict keys
         which may be table headers or alias you give.
         """
+        if self.engine == 'numpy':
+            from exceltojson.columnar import columnar_rows
+            if self.stats is not None:
+                # the numpy engine read, convert and fill a batch together
+                return self.stats.timed_iter('convert', columnar_rows(self))
+            return columnar_rows(self)
+        return self._convert_rows()
+
+    def _convert_rows(self):
+        """ row engine of __call__
+        """
         keys = self.headers
-        sheet = self.sheet
-        start_col = self.start_col
-        content_bak = {}
+        stats = self.stats
+        rows = _sheet_rows(self.sheet, self.start_row+1, self.start_col, self.start_col+len(keys))
+        if stats is not None:
+            rows = stats.timed_iter('read', rows)
         if self.merge_cell:
-            for row_index in _range(self.start_row+1, sheet.nrows):
-                content = _RowProcess(sheet, keys, start_col)(row_index)
-                if not content:
+            texts = self.row_process.texts
+            fill = self.merge_fill()
+            if stats is not None:
+                texts = stats.timed_convert(texts)
+                fill = stats.timed('merge_fill', fill)
+            for row_index, values, types in rows:
+                values = texts(values, types)
+                if not any(values):
                     continue
-
-                # merge cell use the first cell value
-                for key in keys:
-                    if content[key]:
-                        pass
-                    else:
-                        content[key] = content_bak.get(key, '')
-
-                content_bak = content.copy()
-                yield row_index+1, content
+                yield row_index+1, dict(zip(keys, fill(row_index, values)))
         else:
-            for row_index in _range(self.start_row+1, sheet.nrows):
-                content = _RowProcess(sheet, keys, start_col)(row_index)
-                yield row_index+1, content
+            convert = self.row_process.convert
+            if stats is not None:
+                convert = stats.timed_convert(convert)
+            for row_index, values, types in rows:
+                yield row_index+1, convert(values, types)
 
 
 class ProcessExcel(object):
     """transform a excel file to a list json files
     """
 
+    # 'json' one json object or array for each file, 'ndjson' one json row for each line
+    FORMATS = ('json', 'ndjson')
+
+    # save_path which write the rows to stdout
+    STDOUT = '-'
+
     def __init__(self,
                  excel_path,
                  save_path,
@@ -233,148 +472,1074 @@ class ProcessExcel(object):
                  name_sheets=None,
                  merge_cell=True,
                  show_row=True,
-                 patch_sheet_alias=True):
+                 patch_sheet_alias=True,
+                 workers=1,
+                 reader='xlrd',
+                 engine='row',
+                 scan_rows=_SheetProcess.MAX,
+                 scan_cols=_ColProcess.MAX,
+                 output_format='json',
+                 file_contents=None,
+                 incremental=False,
+                 stats=False,
+                 background_write=False,
+                 fsync=False,
+                 range_rows=None,
+                 date_format=DATE_FORMAT):
         """
-        :param excel_path: excel source path
-        :param save_path: save json file directory
+        :param excel_path: excel source path, only a name for messages if file_contents is given
+        :param save_path: save json file directory, '-' write the rows to stdout without chunk
+               files and manifests, it need a single sheet or ndjson format, the ndjson rows of more
+               sheets need show_row and get the sheet name as the '_sheet' field
         :param index_sheets: is a dict value, key is sheet index, value is header alias
                { 0: {'头部': 'header'}}
         :param name_sheets:  is a dict value, key is sheet name, value is header alias
                { 'sheet_name': {'头部': 'header'}}
-        :param merge_cell: treat sheet white cell as a merge cell, use above cell value
+        :param merge_cell: treat sheet white cell as a merge cell, see _SheetProcess.merge_fill: with
+               the merged ranges of a xlsx sheet only the cells in a range take its top left value,
+               otherwise (.xls files, sheets without merged ranges) they use above cell value
         :param show_row: if it is true json file will use this as the key of each sheet row dict value
+        :param workers: convert the sheets with this many worker processes, 1 means no worker process
+        :param reader: 'xlrd' parse a whole sheet in memory, 'stream' read xlsx sheets row by row
+               with bounded memory and has no file size limit
+        :param engine: 'row' convert a sheet row by row, 'numpy' convert batches of rows column
+               by column with numpy, it pays off on long sheets whose columns each hold one
+               cell type, a short or mixed sheet is as fast with 'row'
+        :param scan_rows: rows to scan for the header row of a sheet, None to scan the whole sheet
+        :param scan_cols: the header should start before this column, None for no limit
+        :param output_format: 'json' write a json object or array to each file, 'ndjson' write
+               one row per line, with show_row the row number is the '_row' field of the row
+        :param file_contents: the excel file content bytes, e.g. read from stdin, it is read
+               instead of excel_path
+        :param incremental: keep a fingerprint of each sheet content and options in a state file of
+               save_path, a sheet whose fingerprint is not changed since the last run is skipped and
+               its json files are left as they are
+        :param stats: collect the time of each stage and the counters of each sheet, see stats.py
+        :param background_write: write the json files in a writer thread, the rows are converted
+               while the buffers of the rows before them are written
+        :param fsync: fsync each json file before it replace the old one
+        :param range_rows: with workers, split each sheet into ranges of this many rows which the
+               worker processes convert, instead of giving each worker whole sheets. The json files
+               are the same. Only the xlrd reader and the row engine read a file by ranges, others
+               convert the sheets as without it
+        :param date_format: strftime format of the date cells, default like 2017/01/31
         :return:
         """
 
         # 添加文件大小检查
-        check_file_size(excel_path)
+        check_file_size(excel_path, get_reader(reader).MAX_FILE_SIZE, file_contents)
         
         merge_cell = True if merge_cell else False
+        self.merge_cell = merge_cell
         self.show_row = show_row
         self.patch_sheet = patch_sheet_alias
+        self.reader = reader
+        self.engine = engine
+        self.scan_rows = scan_rows
+        self.scan_cols = scan_cols
+        if output_format not in self.FORMATS:
+            raise ValueError('output format should be one of {} but you give {}'.format(self.FORMATS, output_format))
+        self.output_format = output_format
         self.sheets = []
 
-        if not os.path.exists(save_path):
+        try:
+            self.workers = int(workers)
+        except (TypeError, ValueError):
+            raise ValueError('workers should be a int value but you give {}'.format(workers))
+        if self.workers < 1:
+            raise ValueError('workers should not less than 1 but you give {}'.format(workers))
+
+        if save_path != self.STDOUT and not os.path.exists(save_path):
             raise ValueError('save path: {} not exist'.format(save_path))
 
-        if not os.path.exists(excel_path):
+        if file_contents is None and not os.path.exists(excel_path):
             raise ValueError('Excel file: {} not found'.format(excel_path))
 
+        self.excel_path = excel_path
         self.save_path = save_path
+        self.file_contents = file_contents
+
+        # the workbook is opened once for all sheets, sheets are parsed when they are written
+        self.cache = WorkbookCache()
+        start = time.time()
+        self.book = get_sheets(excel_path, self.cache, reader, file_contents)
+        self._open_time = time.time() - start
+        self.stats = stats
+        self._stats = None
+        # threading.Event, the conversion stop before the next row once it is set, see aio.py
+        self._cancelled = None
+        self.background_write = background_write
+        self.fsync = fsync
+        # _BackgroundWriter of the running conversion
+        self._background = None
+        if range_rows is not None and int(range_rows) < 1:
+            raise ValueError('range rows should be a positive int value but you give {}'.format(range_rows))
+        self.range_rows = range_rows
+        self.date_format = date_format
+        # the running conversion convert the sheets by row ranges
+        self._by_range = False
 
         if index_sheets:
-            self._get_sheets_by_index(excel_path, index_sheets, merge_cell)
+            self._get_sheets_by_index(index_sheets)
         elif name_sheets:
-            self._get_sheets_by_name(merge_cell, name_sheets, excel_path)
+            self._get_sheets_by_name(name_sheets)
         else:
-            self._get_all_sheets_with_no_alias(merge_cell, excel_path)
+            self._get_all_sheets_with_no_alias()
 
-    def _get_all_sheets_with_no_alias(self, merge_cell, path):
-        self.sheets = {index: _SheetProcess(sheet, merge_cell=merge_cell) for
-                       index, sheet in enumerate(get_sheets(path))}
+        if save_path == self.STDOUT and output_format == 'json' and len(self.sheets) > 1:
+            raise ValueError('write json to stdout need a single sheet, use ndjson format for more sheets')
+        if save_path == self.STDOUT and not show_row and len(self.sheets) > 1:
+            raise ValueError('write ndjson rows of more sheets to stdout need the row number, '
+                             'the sheet name is put next to it')
+        # the ndjson rows of the sheets are mixed on stdout, each row get the sheet name field
+        self._sheet_field = save_path == self.STDOUT and len(self.sheets) > 1
+        if save_path == self.STDOUT and incremental:
+            raise ValueError('incremental need a save path to keep the json files')
+        self.incremental = incremental
 
-    def _get_sheets_by_name(self, merge_cell, name_sheets, path):
-        sheets = get_sheet_names(path)
-        name_set = set(sheets.keys())-set(name_sheets.keys())
-        if set(name_sheets.keys()) <= set(sheets.keys()):
+    def _get_all_sheets_with_no_alias(self):
+        self.sheets = {index: None for index in _range(len(self.book))}
+
+    def _get_sheets_by_name(self, name_sheets):
+        sheets = self.book.names
+        name_set = set(sheets)-set(name_sheets.keys())
+        if set(name_sheets.keys()) <= set(sheets):
             pass
         else:
             raise ValueError('sheet names: {} not correct'.format(name_set))
-        self.sheets = {name: _SheetProcess(sheets[name],
-                                           name_sheets[name], merge_cell=merge_cell) for name in name_sheets}
+        self.sheets = {name: name_sheets[name] for name in name_sheets}
         if self.patch_sheet:
             if name_set:
-                self.sheets.update({name: _SheetProcess(sheets[name], merge_cell=merge_cell) for name in name_set})
+                self.sheets.update({name: None for name in name_set})
 
-    def _get_sheets_by_index(self, path, index_sheets, merge_cell):
+    def _get_sheets_by_index(self, index_sheets):
         """ index sheets means only process index in index_sheets,
-        :param path:
         :param index_sheets: it's a dict value, key is the sheet index, value is the header alias
-        :param merge_cell:
         :return:
         """
-        all_sheets = get_sheets(path)
         sheets = {}
         try:
             for index in index_sheets:
                 sheets[int(index)] = index_sheets[index]
         except ValueError:
             raise ValueError('sheet index should be a int value')
-        all_index_set = set([i for i in _range(0, len(all_sheets))])
+        all_index_set = set([i for i in _range(0, len(self.book))])
         index_set = all_index_set - set(sheets.keys())
         if set(sheets.keys()) <= all_index_set:
             pass
         else:
             raise ValueError('sheet index: {} not exist'.format(index_set))
-        self.sheets = {i: _SheetProcess(all_sheets[i], alias=sheets[i], merge_cell=merge_cell) for i in sheets}
+        self.sheets = sheets
 
         if self.patch_sheet:
             if index_set:
-                self.sheets.update({i: _SheetProcess(all_sheets[i], merge_cell=merge_cell) for i in index_set})
+                self.sheets.update({i: None for i in index_set})
+
+    def _sheet_process(self, name, stats=None):
+        """ parse the sheet and find its header
+        :param name: sheet index or sheet name
+        :param stats: SheetStats of the sheet
+        :return: _SheetProcess
+        """
+        start = time.time()
+        sheet = self.book[name] if isinstance(name, int) else self.book.sheet_by_name(name)
+        loaded = time.time()
+        sheet_process = _SheetProcess(sheet, self.sheets[name], merge_cell=self.merge_cell,
+                                      date_mode=self.book.datemode, engine=self.engine, scan_rows=self.scan_rows,
+                                      scan_cols=self.scan_cols, stats=stats, date_format=self.date_format)
+        if stats is not None:
+            stats.times['load'] += loaded - start
+            stats.times['header'] += time.time() - loaded
+        return sheet_process
 
-    def __call__(self, max_row=1000):
+    def __call__(self, max_row=1000, max_bytes=None):
         """ write excel data to json file
-        :param max_row: sheet over max_row should split to another json file
-        :return:
+        :param max_row: sheet over max_row should split to another json file, None for no row limit
+               if max_bytes is given
+        :param max_bytes: a json file should not be larger than this size, a row larger than it
+               is written to a file alone, with max_bytes max_row is not limited to 1000000
+        :return: dict, 'converted' and 'skipped' are the lists of sheets written and the unchanged
+                 sheets skipped by the incremental mode, 'rows' and 'bytes' are the rows and json
+                 bytes written, 'stats' is the ConvertStats with the stats option or None
         """
-        if int(max_row) > 1000000:
-            raise ValueError('max row value should not large than 1000000 but you give {}'.format(max_row))
-        for name in self.sheets:
-            file_name = self._get_base_name(name)
-            if self.show_row:
-                self._write_json(max_row, name, file_name, _type=dict)
-            else:
-                self._write_json(max_row, name, file_name, _type=list)
+        if max_bytes is None:
+            if max_row is None or int(max_row) > 1000000:
+                raise ValueError('max row value should not large than 1000000 but you give {}'.format(max_row))
+        elif int(max_bytes) < 1:
+            raise ValueError('max bytes should be a positive int value but you give {}'.format(max_bytes))
+        # open the workbook again only if it changed since last time
+        start = time.time()
+        self.book = get_sheets(self.excel_path, self.cache, self.reader, self.file_contents)
+        self._stats = None
+        if self.stats:
+            from exceltojson.stats import ConvertStats
+            self._stats = ConvertStats()
+            self._stats.open = self._open_time + time.time() - start
+            self._open_time = 0.0
+        report = {'converted': list(self.sheets), 'skipped': [], 'stats': self._stats}
+        if not self.incremental:
+            report['rows'], report['bytes'] = self._write_sheets(report['converted'], max_row, max_bytes)
+            return report
+
+        state = _ConvertState(self.save_path)
+        fingerprints = {name: self._fingerprint(name, max_row, max_bytes) for name in self.sheets}
+        report['skipped'] = [name for name in self.sheets
+                             if state.unchanged(self._get_base_name(name), fingerprints[name])]
+        report['converted'] = [name for name in self.sheets if name not in report['skipped']]
+
+        def done(name):
+            state.update(self._get_base_name(name), fingerprints[name])
+
+        try:
+            report['rows'], report['bytes'] = self._write_sheets(report['converted'], max_row, max_bytes, done)
+        finally:
+            # the sheets written before an error are not written again next time
+            state.save()
+        return report
+
+    def _write_sheets(self, names, max_row, max_bytes, done=None):
+        """ write the json files of the sheets
+        :param names: sheet index or sheet name list
+        :param done: called with the sheet name after its json files are written
+        :return: rows written, json bytes written
+        """
+        self._by_range = (self.range_rows is not None and self.workers > 1 and self.file_contents is None and
+                          self.reader == 'xlrd' and self.engine == 'row')
+        # the workers open the file themselves and write their own files
+        if (not self._by_range and self.workers > 1 and len(names) > 1 and self.file_contents is None and
+                self.save_path != self.STDOUT):
+            return self._parallel_write(max_row, max_bytes, names, done)
+        background = None
+        if self.background_write and self.save_path != self.STDOUT:
+            background = self._background = _BackgroundWriter()
+        rows = size = 0
+        try:
+            for name in names:
+                file_name = self._get_base_name(name)
+                try:
+                    if self.show_row:
+                        chunks = self._write_json(max_row, name, file_name, _type=dict, max_bytes=max_bytes)
+                    else:
+                        chunks = self._write_json(max_row, name, file_name, _type=list, max_bytes=max_bytes)
+                except ValueError as e:
+                    raise ValueError('sheet {}: {}'.format(name, e))
+                rows += sum(chunk['rows'] for chunk in chunks)
+                size += sum(chunk['bytes'] for chunk in chunks)
+                if done is None:
+                    continue
+                if background is None:
+                    done(name)
+                else:
+                    # the sheet is done once the writer thread wrote its files
+                    background.call(done, name)
+        except BaseException:
+            self._background = None
+            if background is not None:
+                # the error of the conversion is raised, not the one the writes may have after it
+                background.close(check=False)
+            raise
+        self._background = None
+        if background is not None:
+            background.close()
+        return rows, size
+
+    def _fingerprint(self, name, max_row, max_bytes):
+        """ the sheet content fingerprint with all options which change its json files
+        :return: str
+        """
+        options = [self.sheets[name] and sorted(self.sheets[name].items()), self.merge_cell, self.show_row,
+                   self.engine, self.scan_rows, self.scan_cols, self.output_format, max_row, max_bytes,
+                   self.date_format]
+        return '{}|{}'.format(self.book.sheet_fingerprint(name), json.dumps(options))
+
+    def _parallel_write(self, max_row, max_bytes=None, names=None, done=None):
+        """ share the sheets among the worker processes, each worker open the workbook
+        itself and write the json files of its sheets
+        :param max_row: same as __call__
+        :param max_bytes: same as __call__
+        :param names: the sheets to write, all sheets if not given
+        :param done: same as _write_sheets, called for the sheets of a worker after it finished
+        :return: same as _write_sheets
+        """
+        from concurrent.futures import ProcessPoolExecutor
+
+        names = list(self.sheets) if names is None else names
+        workers = min(self.workers, len(names))
+        groups = [{name: self.sheets[name] for name in names[i::workers]} for i in _range(workers)]
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            options = dict(merge_cell=self.merge_cell, show_row=self.show_row, reader=self.reader,
+                           engine=self.engine, scan_rows=self.scan_rows, scan_cols=self.scan_cols,
+                           output_format=self.output_format, stats=self.stats,
+                           background_write=self.background_write, fsync=self.fsync, date_format=self.date_format)
+            futures = [executor.submit(_convert_sheets, self.excel_path, self.save_path, group, max_row, options,
+                                       max_bytes)
+                       for group in groups]
+            rows = size = 0
+            for group, future in zip(groups, futures):
+                # the errors of the workers are raised as they are, a ValueError already tell its sheet
+                report = future.result()
+                rows += report['rows']
+                size += report['bytes']
+                if self._stats is not None:
+                    self._stats.sheets.update(report['stats'].sheets)
+                if done is not None:
+                    for name in group:
+                        done(name)
+        return rows, size
 
     def _get_base_name(self, name):
-        name_format = 'sheet-{}.json' if isinstance(name, int) else '{}.json'
-        return os.path.join(self.save_path, name_format.format(name))
+        name_format = 'sheet-{}.{}' if isinstance(name, int) else '{}.{}'
+        return os.path.join(self.save_path, name_format.format(name, self.output_format))
 
-    def _write_json(self, max_row, name, file_name, _type=None):
+    def _write_json(self, max_row, name, file_name, _type=None, max_bytes=None):
         """
         :param max_row: large than this value will generate a new json file
-                        this value only to limit the json file is to large
+                        this value only to limit the json file is to large, None for no limit
         :param name: is the sheet_name to get sheet object, also can be a index value
         :param file_name: save json file will use this as base file name, if a sheet
-               more than max_row, the file_name will add a '0' between file name and
-               file suffix.
+               more than max_row, the next files are named like sheet-0.part00001.json,
+               a sheet-0.manifest.json list all the files of the sheet
         :param _type: dict or list
-        :return:
+        :param max_bytes: a row which would make the json file larger than this goes to a new file
+        :return: the chunk dicts of the sheet, see _JsonWriter.close
+        """
+        start = time.time()
+        stats = self._stats.sheet(name) if self._stats is not None else None
+        writer_class = _NdjsonWriter if self.output_format == 'ndjson' else _JsonWriter
+        # stdout get all rows, there is no chunk to split to
+        stream = _stdout() if self.save_path == self.STDOUT else None
+        chunks = []
+        writer = writer_class(file_name, _type, stream, self._background, self.fsync)
+        # the worker processes encode the rows of the ranges
+        encoded = self._by_range
+        encode, write = _timed_writer(writer, stats, encoded)
+        try:
+            sheet_process = self._sheet_process(name, stats)
+            if writer_class is _NdjsonWriter and _type is dict and _NdjsonWriter.ROW_KEY in sheet_process.headers:
+                raise ValueError('header {} is the row number field of ndjson'.format(_NdjsonWriter.ROW_KEY))
+            prefix = None
+            if self._sheet_field:
+                if _NdjsonWriter.SHEET_KEY in sheet_process.headers:
+                    raise ValueError('header {} is the sheet name field of ndjson'.format(_NdjsonWriter.SHEET_KEY))
+                prefix = _NdjsonWriter.sheet_prefix(self.book.names[name] if isinstance(name, int) else name)
+            if encoded:
+                rows = self._range_rows(name, sheet_process, writer_class, _type, stats)
+            else:
+                rows = sheet_process()
+            if self._cancelled is not None:
+                rows = _until_cancelled(self._cancelled, rows)
+            for row, data in rows:
+                data = encode(row, data)
+                if prefix is not None:
+                    data = prefix + data[1:]
+                # roll over before the row which would go over a limit, a file has at least one row
+                if stream is None and writer.rows and ((max_row is not None and writer.rows >= max_row) or
+                                    (max_bytes is not None and writer.size_with(data) > max_bytes)):
+                    chunks.append(writer.close())
+                    writer = writer_class(_chunk_name(file_name, len(chunks)), _type, None, self._background,
+                                          self.fsync)
+                    encode, write = _timed_writer(writer, stats, encoded)
+                write(row, data)
+            chunks.append(writer.close())
+        except BaseException:
+            # the chunk being written is not published half written
+            writer.abort()
+            raise
+        finally:
+            self.book.unload_sheet(name)
+        chunks = [chunk for chunk in chunks if chunk is not None]
+        if stream is None and self._background is not None:
+            # after the chunk files in the writer thread
+            self._background.call(_write_manifest, file_name, name, chunks)
+        elif stream is None:
+            _write_manifest(file_name, name, chunks)
+        if stats is not None:
+            stats.rows = sum(chunk['rows'] for chunk in chunks)
+            stats.cells = stats.rows * len(sheet_process.headers)
+            stats.bytes = sum(chunk['bytes'] for chunk in chunks)
+            stats.chunks = len(chunks)
+            stats.total = time.time() - start
+        return chunks
+
+    def _range_rows(self, name, sheet_process, writer_class, _type, stats=None):
+        """ generator, the encoded rows of the sheet in order, the rows are converted and encoded
+        by ranges in the worker processes, a few ranges ahead of the writer. The workers are
+        forked for the sheet where it is safe, see _can_fork, so they have the parsed sheet,
+        otherwise they are spawned and each worker parse the sheet once
+        :param sheet_process: _SheetProcess of the sheet, the header is already found
+        :param stats: SheetStats of the sheet, the stage times and date cells of the workers
+               are added to it
+        :return: (row number, encoded row)
         """
-        container = _Container(_type)
-        size = 0
-        for row, data in self.sheets[name]():
-            container.add_data(row, data)
-            size += 1
-            if size >= max_row:
-                with open(file_name, 'w', encoding='utf-8') as f:
-                    f.write(json.dumps(container.data, indent=2))
-                header, sep, suffix = file_name.rpartition('.')
-                file_name = ''.join([header+'0', sep, suffix])
-                size = 0
-                container.clear()
-        if container.data:
-            with open(file_name, 'w', encoding='utf-8') as f:
-                f.write(json.dumps(container.data))
-
-
-class _Container(object):
-    """solve the dict and list save data different
+        import multiprocessing
+        from collections import deque
+        from concurrent.futures import ProcessPoolExecutor
+
+        options = dict(merge_cell=self.merge_cell, reader=self.reader, scan_rows=self.scan_rows,
+                       scan_cols=self.scan_cols, date_format=self.date_format)
+        first_row = sheet_process.start_row + 1
+        starts = iter(_range(first_row, sheet_process.sheet.nrows, int(self.range_rows)))
+        futures = deque()
+        # merge cell, the last non-empty value of each column before the range
+        carry = [''] * len(sheet_process.headers)
+        encode = writer_class.dict_encode if _type is dict else writer_class.list_encode
+        if _can_fork():
+            context = multiprocessing.get_context('fork')
+            _range_sheets[(self.excel_path, name)] = sheet_process
+        else:
+            context = multiprocessing.get_context('spawn')
+        executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+        try:
+            while True:
+                while len(futures) < self.workers * 2:
+                    start = next(starts, None)
+                    if start is None:
+                        break
+                    futures.append(executor.submit(
+                        _convert_range, self.excel_path, name, self.sheets[name], options, start,
+                        start + int(self.range_rows), writer_class is _NdjsonWriter, _type is dict,
+                        stats is not None))
+                if not futures:
+                    return
+                rows, tail, range_stats = futures.popleft().result()
+                if range_stats is not None:
+                    stats.add(range_stats)
+                for row, data in rows:
+                    if isinstance(data, list):
+                        # the cells empty from the range start take the values of the ranges before
+                        data = encode(row, dict(zip(sheet_process.headers, [
+                            value if value is not None else last for value, last in zip(data, carry)])))
+                    yield row, data
+                if tail is not None:
+                    carry = [value if value is not None else last for value, last in zip(tail, carry)]
+        finally:
+            for future in futures:
+                future.cancel()
+            executor.shutdown()
+            _range_sheets.pop((self.excel_path, name), None)
+
+
+def iter_rows(excel_path, sheet=0, alias=None, merge_cell=True, as_tuple=False, reader='xlrd', engine='row',
+              scan_rows=_SheetProcess.MAX, scan_cols=_ColProcess.MAX, file_contents=None, check_size=False,
+              date_format=DATE_FORMAT):
+    """ generator, the rows of a sheet as ProcessExcel write them, without writing any json file.
+    The rows are converted as they are asked for, with the stream reader a sheet is read with
+    bounded memory too
+
+        for row, data in iter_rows('book.xlsx', sheet='Sheet1', alias={'头部': 'header'}):
+            ...
+
+    :param excel_path: excel source path, only a name for messages if file_contents is given
+    :param sheet: sheet index or sheet name
+    :param alias: header alias dict of the sheet, like the values of ProcessExcel index_sheets
+    :param merge_cell: same as ProcessExcel
+    :param as_tuple: yield the cell values as a tuple in header order instead of a dict, the
+           header order is given by headers()
+    :param reader: same as ProcessExcel
+    :param engine: same as ProcessExcel
+    :param scan_rows: same as ProcessExcel
+    :param scan_cols: same as ProcessExcel
+    :param file_contents: the excel file content bytes, they are read instead of excel_path
+    :param check_size: check the file size limit of the reader as ProcessExcel does
+    :param date_format: same as ProcessExcel
+    :return: (excel row number, dict or tuple), without merge cell an empty row is None
+    """
+    if check_size:
+        check_file_size(excel_path, get_reader(reader).MAX_FILE_SIZE, file_contents)
+    # the workbook is not cached, it belong to this generator only
+    book = _open_book(excel_path, reader, file_contents)
+    try:
+        sheet_process = _SheetProcess(_book_sheet(book, sheet), alias, merge_cell=merge_cell,
+                                      date_mode=book.datemode, engine=engine, scan_rows=scan_rows,
+                                      scan_cols=scan_cols, date_format=date_format)
+        if not as_tuple:
+            for row in sheet_process():
+                yield row
+            return
+        keys = sheet_process.headers
+        for row, data in sheet_process():
+            yield row, data if data is None else tuple(data[key] for key in keys)
+    finally:
+        book.release_resources()
+
+
+def headers(excel_path, sheet=0, alias=None, reader='xlrd', scan_rows=_SheetProcess.MAX,
+            scan_cols=_ColProcess.MAX, file_contents=None):
+    """ the header of a sheet, the keys of the iter_rows dicts in the order of its tuples
+
+        keys = headers('book.xlsx', sheet='Sheet1')
+        for row, values in iter_rows('book.xlsx', sheet='Sheet1', as_tuple=True):
+            ...
+
+    :param alias: same as iter_rows, the keys are the alias
+    :return: (excel row number of the header, header tuple)
+    """
+    book = _open_book(excel_path, reader, file_contents)
+    try:
+        sheet_process = _SheetProcess(_book_sheet(book, sheet), alias, merge_cell=False, date_mode=book.datemode,
+                                      scan_rows=scan_rows, scan_cols=scan_cols)
+        return sheet_process.start_row + 1, tuple(sheet_process.headers)
+    finally:
+        book.release_resources()
+
+
+def _open_book(excel_path, reader, file_contents):
+    """ open a workbook which is not cached, the caller release it
+    """
+    if file_contents is None and not os.path.exists(excel_path):
+        raise ValueError('Excel file: {} not found'.format(excel_path))
+    return get_sheets(excel_path, reader=reader, file_contents=file_contents)
+
+
+def _book_sheet(book, sheet):
+    """
+    :param sheet: sheet index or sheet name
+    :return: the sheet of the workbook
     """
-    def __init__(self, _type):
-        self.data = _type()
-        self._type = _type
+    if isinstance(sheet, int):
+        if not 0 <= sheet < len(book):
+            raise ValueError('sheet index: {} not exist'.format(sheet))
+        return book[sheet]
+    if sheet not in book.names:
+        raise ValueError('sheet names: {} not correct'.format(sheet))
+    return book.sheet_by_name(sheet)
+
+
+class _ConvertState(object):
+    """the state file of the incremental mode in the save path, it keep the fingerprint of
+    the sheets written there, keyed by the sheet json file name
+    """
+
+    FILE_NAME = '.excel2json-state.json'
+
+    def __init__(self, save_path):
+        self.path = os.path.join(save_path, self.FILE_NAME)
+        self.save_path = save_path
+        self.fingerprints = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding='utf-8') as f:
+                    self.fingerprints = json.load(f)['sheets']
+            except (ValueError, KeyError, TypeError):
+                # a broken state file only means all sheets are written again
+                self.fingerprints = {}
+
+    def unchanged(self, file_name, fingerprint):
+        """ the sheet has the same fingerprint and its json files are all there
+        :param file_name: the sheet json file name
+        """
+        name = os.path.basename(file_name)
+        if self.fingerprints.get(name) != fingerprint:
+            return False
+        try:
+            with open(_manifest_name(file_name), encoding='utf-8') as f:
+                chunks = json.load(f)['chunks']
+        except (IOError, OSError, ValueError, KeyError):
+            return False
+        return all(os.path.exists(os.path.join(self.save_path, chunk['file'])) for chunk in chunks)
+
+    def update(self, file_name, fingerprint):
+        self.fingerprints[os.path.basename(file_name)] = fingerprint
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({'sheets': self.fingerprints}, indent=2, sort_keys=True))
+        _replace(temp_path, self.path)
+
+
+def _replace(temp_path, path):
+    """ move the temp file over path in one step, readers see the old file or the new one
+    """
+    if PY2:
+        os.rename(temp_path, path)
+    else:
+        os.replace(temp_path, path)
+
+
+def _stdout():
+    """binary stdout, the json writers write bytes"""
+    return getattr(sys.stdout, 'buffer', sys.stdout)
+
+
+def _chunk_name(file_name, index):
+    """ json file name of a sheet chunk, the first chunk keep the sheet file name
+    :param index: chunk index
+    """
+    if not index:
+        return file_name
+    header, sep, suffix = file_name.rpartition('.')
+    return '{}.part{:05d}{}{}'.format(header, index, sep, suffix)
+
+
+def _manifest_name(file_name):
+    return '{}.manifest.json'.format(file_name.rpartition('.')[0])
+
+
+def _write_manifest(file_name, name, chunks):
+    """ write the manifest of a sheet, so the chunks can be found without listing the directory
+    :param file_name: the sheet json file name
+    :param name: sheet index or sheet name
+    :param chunks: list of chunk dict, see _JsonWriter.close
+    :return:
+    """
+    manifest = {
+        'sheet': name,
+        'rows': sum(chunk['rows'] for chunk in chunks),
+        'chunks': chunks,
+    }
+    temp_name = _manifest_name(file_name) + '.tmp'
+    with open(temp_name, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(manifest, indent=2))
+    _replace(temp_name, _manifest_name(file_name))
+
+
+def _until_cancelled(cancelled, rows):
+    """ the rows, a ValueError is raised once the cancelled event is set
+    """
+    for row in rows:
+        if cancelled.is_set():
+            raise ValueError('conversion cancelled')
+        yield row
+
+
+def _timed_writer(writer, stats, encoded=False):
+    """
+    :param encoded: the rows are encoded already, encode return them as they are
+    :return: encode and write functions of the writer, timed if stats is given
+    """
+    encode = _encoded if encoded else writer.encode
+    if stats is None:
+        return encode, writer.write
+    return stats.timed('encode', encode), stats.timed('write', writer.write)
+
+
+def _encoded(row, data):
+    return data
+
+
+def _can_fork():
+    """ fork is safe for the range workers: it is not macOS, where fork is unsafe and python
+    spawn by default, and no other thread is running, e.g. the writer thread or the thread
+    pool of aio, a forked child only has the forking thread and may inherit their held locks
+    """
+    import multiprocessing
+
+    return (sys.platform != 'darwin' and threading.active_count() == 1 and
+            'fork' in multiprocessing.get_all_start_methods())
+
+
+# the sheet converted by row ranges, the forked worker processes find it here
+_range_sheets = {}
+
+# the workbooks opened by a worker process which is not forked, a sheet is parsed once
+_range_books = WorkbookCache()
+
+
+def _convert_range(excel_path, name, alias, options, start, end, ndjson, show_row, stats=False):
+    """ worker process task, convert and encode the data rows [start, end) of a sheet
+    :param name: sheet index or sheet name
+    :param alias: header alias of the sheet
+    :param options: merge_cell, reader, scan_rows, scan_cols and date_format of ProcessExcel
+    :param ndjson: encode the rows for ndjson files
+    :param show_row: encode the rows for dict json files
+    :param stats: time the read, convert, merge_fill and encode stages of the range and count its
+           date cells
+    :return: (rows, tail, stats), rows is a list of (row number, encoded row). Without the values
+             of the ranges before it a merge cell row which still has cells to fill is a cell
+             text list, None for the cells which take the last value before the range. tail is
+             the last non-empty value of each column in the range, None for a column without
+             one, tail is None without merge cell. stats is the SheetStats of the range or None
+    """
+    if stats:
+        from exceltojson.stats import SheetStats
+
+        stats = SheetStats()
+    else:
+        stats = None
+    sheet_process = _range_sheets.get((excel_path, name))
+    if sheet_process is None:
+        book = get_sheets(excel_path, _range_books, options['reader'])
+        sheet_process = _SheetProcess(book[name] if isinstance(name, int) else book.sheet_by_name(name), alias,
+                                      merge_cell=options['merge_cell'], date_mode=book.datemode,
+                                      scan_rows=options['scan_rows'], scan_cols=options['scan_cols'],
+                                      date_format=options['date_format'])
+    sheet = sheet_process.sheet
+    writer_class = _NdjsonWriter if ndjson else _JsonWriter
+    encode = writer_class.dict_encode if show_row else writer_class.list_encode
+    keys = sheet_process.headers
+    end_col = sheet_process.start_col + len(keys)
+    rows = ((row, sheet.row_values(row, sheet_process.start_col, end_col),
+             sheet.row_types(row, sheet_process.start_col, end_col))
+            for row in _range(start, min(end, sheet.nrows)))
+    texts = sheet_process.row_process.texts
+    convert = sheet_process.row_process.convert
+    if stats is not None:
+        rows = stats.timed_iter('read', rows)
+        texts = stats.timed_convert(texts)
+        convert = stats.timed_convert(convert)
+        encode = stats.timed('encode', encode)
+    result = []
+    if not sheet_process.merge_cell:
+        for row_index, values, types in rows:
+            result.append((row_index+1, encode(row_index+1, convert(values, types))))
+        return result, None, stats
+
+    fill = sheet_process.merge_fill()
+    if isinstance(fill, _MergedRangeFill):
+        row_texts = sheet_process.row_process.texts
+        fill.seed(start, lambda rowx: row_texts(sheet.row_values(rowx, sheet_process.start_col, end_col),
+                                                sheet.row_types(rowx, sheet_process.start_col, end_col)))
+        if stats is not None:
+            fill = stats.timed('merge_fill', fill)
+        for row_index, values, types in rows:
+            values = texts(values, types)
+            if any(values):
+                result.append((row_index+1, encode(row_index+1, dict(zip(keys, fill(row_index, values))))))
+        return result, None, stats
+
+    # _ForwardFill, None stand for the value before the range
+    def forward_fill(values, last):
+        return [value or previous for value, previous in zip(values, last)]
+
+    if stats is not None:
+        forward_fill = stats.timed('merge_fill', forward_fill)
+    last = [None] * len(keys)
+    for row_index, values, types in rows:
+        values = texts(values, types)
+        if not any(values):
+            continue
+        if not all(values):
+            values = forward_fill(values, last)
+        last = values
+        if None in values:
+            result.append((row_index+1, values))
+        else:
+            result.append((row_index+1, encode(row_index+1, dict(zip(keys, values)))))
+    return result, last, stats
+
+
+def _convert_sheets(excel_path, save_path, sheets, max_row, options, max_bytes=None):
+    """ worker process task, write the json files of a part of the workbook sheets
+    :param sheets: is a dict value, key is sheet index or sheet name, value is header alias
+    :param options: ProcessExcel keyword arguments
+    :param max_bytes: same as ProcessExcel.__call__
+    :return: same as ProcessExcel.__call__
+    """
+    if isinstance(next(iter(sheets)), int):
+        excel = ProcessExcel(excel_path, save_path, index_sheets=sheets, patch_sheet_alias=False, **options)
+    else:
+        excel = ProcessExcel(excel_path, save_path, name_sheets=sheets, patch_sheet_alias=False, **options)
+    return excel(max_row, max_bytes)
+
+
+class _FileSink(object):
+    """a json file written to a temp file first, the temp file replace the json file when
+    it is closed, so a reader never see a part of a json file
+    """
+
+    # write buffer size of the json file
+    BUFFER_SIZE = 1024 * 1024
+
+    def __init__(self, file_name, fsync=False):
+        self.file_name = file_name
+        self.temp_name = file_name + '.tmp'
+        self.fsync = fsync
+        self.f = open(self.temp_name, 'wb', buffering=self.BUFFER_SIZE)
+
+    def write(self, data):
+        self.f.write(data)
+
+    def close(self):
+        try:
+            self.f.flush()
+            if self.fsync:
+                os.fsync(self.f.fileno())
+            self.f.close()
+            _replace(self.temp_name, self.file_name)
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        """ drop the temp file, the json file is left as it was
+        """
+        try:
+            self.f.close()
+        except (IOError, OSError):
+            pass
+        if os.path.exists(self.temp_name):
+            os.remove(self.temp_name)
+
+
+class _BackgroundWriter(object):
+    """a thread doing the file writes of the json writers in order, the converting
+    thread hand the write calls over through a bounded queue, it wait if the writes
+    fall behind. The first error stop the writes, it is raised by the next call or close,
+    only the clean up calls still run after it
+    """
+
+    # write calls waiting for the thread
+    QUEUE_SIZE = 16
+
+    def __init__(self):
+        from six.moves.queue import Queue
+
+        self.queue = Queue(self.QUEUE_SIZE)
+        self.error = None
+        self.thread = threading.Thread(target=self._run, name='excel2json-writer')
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                return
+            cleanup, func, args = task
+            if self.error is None or cleanup:
+                try:
+                    func(*args)
+                except Exception as e:
+                    if self.error is None:
+                        self.error = e
+
+    def _check(self):
+        if self.error is not None:
+            raise self.error
+
+    def call(self, func, *args):
+        """ call func(*args) in the writer thread after the calls before it
+        """
+        self._check()
+        self.queue.put((False, func, args))
+
+    def cleanup(self, func, *args):
+        """ same as call, but func is called even after an error and no error is raised here
+        """
+        self.queue.put((True, func, args))
+
+    def close(self, check=True):
+        """ wait for the calls left
+        :param check: raise the error of the writes, False when an error is already raised
+        """
+        self.queue.put(None)
+        self.thread.join()
+        if check:
+            self._check()
+
+
+class _BackgroundSink(object):
+    """a _FileSink written by the writer thread, the bytes are handed over in buffers
+    """
+
+    BUFFER_SIZE = _FileSink.BUFFER_SIZE
+
+    def __init__(self, background, file_name, fsync=False):
+        self.background = background
+        self.parts = []
+        self.size = 0
+        self.sink = None
+        background.call(self._open, file_name, fsync)
+
+    def _open(self, file_name, fsync):
+        # in the writer thread
+        self.sink = _FileSink(file_name, fsync)
+
+    def _write(self, data):
+        try:
+            self.sink.write(data)
+        except BaseException:
+            # the writes after it are skipped, so the close never comes
+            self.sink.abort()
+            raise
+
+    def _close(self):
+        self.sink.close()
+
+    def _abort(self):
+        if self.sink is not None:
+            self.sink.abort()
+
+    def _hand_over(self):
+        if self.parts:
+            self.background.call(self._write, b''.join(self.parts))
+            self.parts = []
+            self.size = 0
+
+    def write(self, data):
+        self.parts.append(data)
+        self.size += len(data)
+        if self.size >= self.BUFFER_SIZE:
+            self._hand_over()
+
+    def close(self):
+        self._hand_over()
+        self.background.call(self._close)
+
+    def abort(self):
+        """ drop the rows not handed over and the temp file
+        """
+        self.parts = []
+        self.background.cleanup(self._abort)
+
+
+class _JsonWriter(object):
+    """write the rows of one json file as they come, so a chunk is never held
+    in memory, the file is only created when the first row arrives. The bytes are
+    counted and hashed as they are written for the sheet manifest
+    """
+
+    # between two rows
+    SEPARATOR = b', '
+
+    def __init__(self, file_name, _type, stream=None, background=None, fsync=False):
+        """
+        :param file_name: json file name
+        :param _type: dict or list
+        :param stream: binary file object to write to instead of the file, it is not closed
+        :param background: _BackgroundWriter, write the file in its thread if given
+        :param fsync: fsync the file before it replace the old one
+        """
+        self.file_name = file_name
+        self.stream = stream
+        self.background = background
+        self.fsync = fsync
+        self.f = None
+        self.closed = False
+        self.rows = 0
+        self.first_row = self.last_row = None
+        self.size = 0
+        self.checksum = hashlib.sha256()
         if _type is dict:
-            self.add_data = self.dict_add
+            self.brackets = '{}'
+            self.encode = self.dict_encode
+        else:
+            self.brackets = '[]'
+            self.encode = self.list_encode
+
+    def _write(self, data):
+        self.f.write(data)
+        self.checksum.update(data)
+        self.size += len(data)
+
+    def _begin(self, row):
+        """open the file for the first row, later rows need a separator
+        """
+        if self.f is None:
+            self.f = self.stream or self._open()
+            self._write(self.brackets[0].encode('utf-8'))
+            self.first_row = row
+        else:
+            self._write(self.SEPARATOR)
+        self.rows += 1
+        self.last_row = row
+
+    def _open(self):
+        if self.background is not None:
+            return _BackgroundSink(self.background, self.file_name, self.fsync)
+        return _FileSink(self.file_name, self.fsync)
+
+    @staticmethod
+    def dict_encode(row, data):
+        return '"{}": {}'.format(row, json.dumps(data)).encode('utf-8')
+
+    @staticmethod
+    def list_encode(row, data):
+        return json.dumps(data).encode('utf-8')
+
+    def size_with(self, data):
+        """ the file size if the encoded row is written and the file is closed
+        """
+        return (self.size + (len(self.SEPARATOR) if self.rows else len(self.brackets[0])) + len(data) +
+                len(self.brackets[1]))
+
+    def write(self, row, data):
+        """ write a row encoded by self.encode
+        """
+        self._begin(row)
+        self._write(data)
+
+    def add_data(self, row, data):
+        self.write(row, self.encode(row, data))
+
+    def close(self):
+        """
+        :return: the chunk dict of the sheet manifest, None if no row is written
+        """
+        if self.closed:
+            return
+        if self.f is None:
+            if self.stream is None:
+                self.closed = True
+                return
+            # a stream without row still get an empty json
+            self.f = self.stream
+            self._write(self.brackets[0].encode('utf-8'))
+        self._write(self.brackets[1].encode('utf-8'))
+        if self.stream is None:
+            self.f.close()
+        else:
+            self.f.flush()
+        self.closed = True
+        self.f = None
+        return {
+            'file': os.path.basename(self.file_name),
+            'first_row': self.first_row,
+            'last_row': self.last_row,
+            'rows': self.rows,
+            'bytes': self.size,
+            'sha256': self.checksum.hexdigest(),
+        }
+
+    def abort(self):
+        """ give up the file after an error, the temp file is dropped and the json file is
+        left as it was, a stream is only flushed
+        """
+        if self.closed:
+            return
+        self.closed = True
+        if self.f is None:
+            return
+        if self.stream is None:
+            self.f.abort()
         else:
-            self.add_data = self.list_add
+            try:
+                self.f.flush()
+            except (IOError, OSError):
+                # e.g. the reader of stdout is gone, the error is already raised
+                pass
+        self.f = None
+
+
+class _NdjsonWriter(_JsonWriter):
+    """write one json row for each line, the row number is a field of a dict row
+    """
+
+    SEPARATOR = b''
 
-    def clear(self):
-        self.data = self._type()
+    # field of the row number
+    ROW_KEY = '_row'
+    # field of the sheet name when the rows of more sheets go to stdout
+    SHEET_KEY = '_sheet'
 
-    def dict_add(self, *args):
-        self.data[args[0]] = args[1]
+    def __init__(self, file_name, _type, stream=None, background=None, fsync=False):
+        super(_NdjsonWriter, self).__init__(file_name, _type, stream, background, fsync)
+        self.brackets = ('', '')
 
-    def list_add(self, *args):
-        self.data.append(args[1])
+    @staticmethod
+    def dict_encode(row, data):
+        if not data:
+            return '{{"{}": {}}}\n'.format(_NdjsonWriter.ROW_KEY, row).encode('utf-8')
+        # put the row number in front of the row fields without copying the dict
+        return '{{"{}": {}, {}\n'.format(_NdjsonWriter.ROW_KEY, row, json.dumps(data)[1:]).encode('utf-8')
 
+    @staticmethod
+    def list_encode(row, data):
+        return (json.dumps(data) + '\n').encode('utf-8')
+
+    @staticmethod
+    def sheet_prefix(sheet):
+        """ put in place of the opening brace of an encoded dict row, the sheet name field go first
+        """
+        return '{{"{}": {}, '.format(_NdjsonWriter.SHEET_KEY, json.dumps(sheet)).encode('utf-8')
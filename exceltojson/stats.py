@@ -0,0 +1,133 @@
+# -*- coding: UTF-8 -*-
+"""timers and counters of a conversion, they are only collected when asked for: the
+stage functions of a sheet are wrapped with timers, so there is nothing to pay when
+the stats are off
+"""
+from __future__ import unicode_literals
+
+from time import time as _time
+
+from xlrd import XL_CELL_DATE
+
+
+class SheetStats(object):
+    """the time of each stage in seconds and the counters of a sheet
+    """
+
+    # load: parse the sheet, header: find the header, read: read the rows from the sheet,
+    # convert: cell values to text, merge_fill: merge cell stage, encode: json.dumps,
+    # write: write the json files
+    STAGES = ('load', 'header', 'read', 'convert', 'merge_fill', 'encode', 'write')
+
+    def __init__(self):
+        self.times = dict.fromkeys(self.STAGES, 0.0)
+        self.total = 0.0
+        self.rows = 0
+        self.cells = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.date_cells = 0
+
+    def timed(self, stage, func):
+        """ func which add its run time to the stage
+        """
+        times = self.times
+
+        def wrapper(*args):
+            start = _time()
+            try:
+                return func(*args)
+            finally:
+                times[stage] += _time() - start
+        return wrapper
+
+    def timed_convert(self, func):
+        """ timed cell conversion func(values, types), which also count the date cells
+        """
+        times = self.times
+
+        def wrapper(values, types):
+            start = _time()
+            try:
+                return func(values, types)
+            finally:
+                times['convert'] += _time() - start
+                self.date_cells += list(types).count(XL_CELL_DATE)
+        return wrapper
+
+    def timed_iter(self, stage, iterable):
+        """ iterate iterable, the time to get each item is added to the stage
+        """
+        times = self.times
+        iterator = iter(iterable)
+        while True:
+            start = _time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                times[stage] += _time() - start
+                return
+            times[stage] += _time() - start
+            yield item
+
+    def add(self, other):
+        """ add the stage times and date cells of a part of the sheet, e.g. a row range converted
+        by a worker process, the times of the workers add up so they can be more than the total
+        """
+        for stage, seconds in other.times.items():
+            self.times[stage] += seconds
+        self.date_cells += other.date_cells
+
+    def as_dict(self):
+        return dict(times=dict(self.times), total=self.total, rows=self.rows, cells=self.cells,
+                    bytes=self.bytes, chunks=self.chunks, date_cells=self.date_cells)
+
+    @classmethod
+    def from_dict(cls, data):
+        """ the stats of as_dict
+        """
+        stats = cls()
+        stats.times.update(data['times'])
+        for key in ('total', 'rows', 'cells', 'bytes', 'chunks', 'date_cells'):
+            setattr(stats, key, data[key])
+        return stats
+
+
+class ConvertStats(object):
+    """the stats of a ProcessExcel run, `sheets` keep a SheetStats for each sheet
+    """
+
+    def __init__(self):
+        # open the workbook
+        self.open = 0.0
+        self.sheets = {}
+
+    def sheet(self, name):
+        return self.sheets.setdefault(name, SheetStats())
+
+    def as_dict(self):
+        return dict(open=self.open, sheets={name: stats.as_dict() for name, stats in self.sheets.items()})
+
+    @classmethod
+    def from_dict(cls, data):
+        """ the stats of as_dict, e.g. of a batch report entry
+        """
+        stats = cls()
+        stats.open = data['open']
+        stats.sheets = {name: SheetStats.from_dict(sheet) for name, sheet in data['sheets'].items()}
+        return stats
+
+    def format(self):
+        """
+        :return: a text table, a line for each sheet
+        """
+        columns = SheetStats.STAGES + ('total',)
+        lines = ['open workbook: {:.3f}s'.format(self.open),
+                 ' '.join(['{:>12}'.format('sheet')] + ['{:>10}'.format(column) for column in columns] +
+                          ['{:>10}'.format(column) for column in ('rows', 'cells', 'bytes', 'chunks', 'dates')])]
+        for name, stats in self.sheets.items():
+            times = [stats.times[stage] for stage in SheetStats.STAGES] + [stats.total]
+            lines.append(' '.join(['{:>12}'.format(name)] + ['{:>9.3f}s'.format(t) for t in times] +
+                                  ['{:>10}'.format(count) for count in (stats.rows, stats.cells, stats.bytes,
+                                                                        stats.chunks, stats.date_cells)]))
+        return '\n'.join(lines)
@@ -1,18 +1,453 @@
-import xlrd
+# xlrd, zipfile and hashlib are imported where a workbook is opened, so the command line
+# start fast when it does not convert anything
 from os.path import join, dirname, abspath
+import io
 import os
+import re
+import sys
 
+# xlrd.XL_CELL_EMPTY
+XL_CELL_EMPTY = 0
 
-def get_sheets(path):
-    book = xlrd.open_workbook(path)
-    os.environ['date_mode'] = str(book.datemode)
-    return book.sheets()
+try:
+    from collections.abc import Mapping, Sequence
+except ImportError:
+    from collections import Mapping, Sequence
 
 
-def get_sheet_names(file_name):
-    work_book = xlrd.open_workbook(file_name)
-    sheets = work_book.sheet_names()
-    return {i.strip(): work_book.sheet_by_name(i) for i in sheets}
+def _open_xlsx_book(zf):
+    """read the xlsx parts shared by all sheets: relationships, sheet list, styles
+    (which tell date cells) and shared strings
+    :param zf: zipfile.ZipFile of the workbook
+    :return: (xlrd book without sheet content, zip component names, sheet xml names),
+             None if it is not a xlsx file
+    """
+    from xlrd import xlsx
+    from xlrd.book import Book
+
+    names = {xlsx.X12Book.convert_filename(name): name for name in zf.namelist()}
+    if 'xl/workbook.xml' not in names:
+        return
+
+    xlsx.ensure_elementtree_imported(0, sys.stdout)
+    book = Book()
+    book.logfile = sys.stdout
+    book.verbosity = 0
+    book.formatting_info = False
+    book.use_mmap = False
+    book.on_demand = True
+    book.ragged_rows = False
+
+    x12book = xlsx.X12Book(book, book.logfile, 0)
+    with zf.open(names['xl/_rels/workbook.xml.rels']) as stream:
+        x12book.process_rels(stream)
+    with zf.open(names['xl/workbook.xml']) as stream:
+        x12book.process_stream(stream, 'Workbook')
+    if 'xl/styles.xml' in names:
+        with zf.open(names['xl/styles.xml']) as stream:
+            xlsx.X12Styles(book, book.logfile, 0).process_stream(stream, 'styles')
+    if 'xl/sharedstrings.xml' in names:
+        with zf.open(names['xl/sharedstrings.xml']) as stream:
+            xlsx.X12SST(book, book.logfile, 0).process_stream(stream, 'SST')
+    return book, names, x12book.sheet_targets
+
+
+class Workbook(Sequence):
+    """a workbook which only parse a sheet when the sheet is asked for, use it as
+    the list of sheets, and `unload_sheet` to release a sheet which is done with.
+    xlrd ignore on_demand for xlsx file, so xlsx sheets are parsed here one by one
+    with the xlrd xlsx parsers
+    """
+
+    # xlrd hold the whole sheet in memory, larger file should use the stream reader
+    MAX_FILE_SIZE = 100 * 1024 * 1024
+
+    def __init__(self, path, file_contents=None):
+        """
+        :param path: excel file path, only a name for messages if file_contents is given
+        :param file_contents: the excel file content bytes, read instead of the file
+        """
+        self.path = path
+        self._file_contents = file_contents
+        self._file_hash = None
+        self._zip = None
+        self._loaded = set()
+        # BytesIO share the bytes, the content is not copied
+        source = path if file_contents is None else io.BytesIO(file_contents)
+        import zipfile
+
+        self.book = self._open_xlsx(source) if zipfile.is_zipfile(source) else None
+        if self.book is None:
+            import xlrd
+            self.book = xlrd.open_workbook(path, file_contents=file_contents, on_demand=True)
+        self.datemode = self.book.datemode
+        # sheet names are stripped
+        self.names = [name.strip() for name in self.book.sheet_names()]
+        self._name_index = {name: index for index, name in enumerate(self.names)}
+
+    def _open_xlsx(self, source):
+        """the sheets are left in the zip until they are asked for
+        :param source: file path or file object
+        :return: xlrd book without sheet content, None if it is not a xlsx file
+        """
+        import zipfile
+
+        zf = zipfile.ZipFile(source)
+        opened = _open_xlsx_book(zf)
+        if opened is None:
+            zf.close()
+            return
+        self._zip = zf
+        book, self._component_names, self._sheet_targets = opened
+        return book
+
+    def __len__(self):
+        return self.book.nsheets
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sheet index {} out of range'.format(index))
+        if self._zip is None:
+            return self.book.sheet_by_index(index)
+
+        sheet = self.book._sheet_list[index]
+        if index not in self._loaded:
+            from xlrd import xlsx
+            with self._zip.open(self._component_names[self._sheet_targets[index]]) as stream:
+                xlsx.X12Sheet(sheet, sheet.logfile, 0).process_stream(stream)
+            sheet.tidy_dimensions()
+            self._loaded.add(index)
+        return sheet
+
+    def sheet_index(self, name_or_index):
+        if isinstance(name_or_index, int):
+            return name_or_index
+        return self._name_index[name_or_index]
+
+    def sheet_by_name(self, name):
+        return self[self._name_index[name]]
+
+    def sheet_loaded(self, name_or_index):
+        index = self.sheet_index(name_or_index)
+        if self._zip is None:
+            return self.book.sheet_loaded(index)
+        return index in self._loaded
+
+    def unload_sheet(self, name_or_index):
+        """release a parsed sheet, it will be parsed again if it is asked for
+        """
+        index = self.sheet_index(name_or_index)
+        if self._zip is None:
+            self.book.unload_sheet(index)
+        elif index in self._loaded:
+            from xlrd.sheet import Sheet
+            old = self.book._sheet_list[index]
+            sheet = Sheet(self.book, position=None, name=old.name, number=index)
+            sheet.utter_max_rows = old.utter_max_rows
+            sheet.utter_max_cols = old.utter_max_cols
+            self.book._sheet_list[index] = sheet
+            self._loaded.discard(index)
+
+    def sheet_fingerprint(self, name_or_index):
+        """ a cheap fingerprint of the sheet content, nothing is parsed: a xlsx sheet use the crc
+        and size of its xml part and of the parts shared by all sheets which the zip already has,
+        a xls sheet use the hash of the whole file
+        :return: str
+        """
+        index = self.sheet_index(name_or_index)
+        if self._zip is None:
+            if self._file_hash is None:
+                import hashlib
+                checksum = hashlib.sha256()
+                if self._file_contents is not None:
+                    checksum.update(self._file_contents)
+                else:
+                    with open(self.path, 'rb') as f:
+                        for block in iter(lambda: f.read(1024 * 1024), b''):
+                            checksum.update(block)
+                self._file_hash = checksum.hexdigest()
+            return self._file_hash
+        parts = [self._sheet_targets[index], 'xl/workbook.xml', 'xl/styles.xml', 'xl/sharedstrings.xml']
+        infos = [self._zip.getinfo(self._component_names[part]) for part in parts if part in self._component_names]
+        return ','.join('{:08x}:{}'.format(info.CRC, info.file_size) for info in infos)
+
+    def release_resources(self):
+        if self._zip is not None:
+            self._zip.close()
+        self.book.release_resources()
+
+
+class _SheetNames(Mapping):
+    """sheet name to sheet mapping, a sheet is parsed when it is looked up
+    """
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+
+    def __getitem__(self, name):
+        return self.workbook.sheet_by_name(name)
+
+    def __iter__(self):
+        return iter(self.workbook.names)
+
+    def __len__(self):
+        return len(self.workbook.names)
+
+
+class _RowCollector(object):
+    """stand in for the xlrd sheet the xlrd xlsx row parser put cells into, it only
+    keep the cells of the current row
+    """
+
+    def __init__(self, book):
+        self.book = book
+        self.merged_cells = []
+        self.cells = []
+        self._xf_index_to_xl_type_map = book._xf_index_to_xl_type_map
+
+    def put_cell(self, rowx, colx, ctype, value, xf_index):
+        if ctype is None:
+            # a number, the cell style tell whether it is a date
+            ctype = self._xf_index_to_xl_type_map[xf_index]
+        self.cells.append((colx, ctype, value))
+
+
+_MERGE_CELL_REF = re.compile(br'<(?:\w+:)?mergeCell\b[^>]*?\bref="([A-Za-z$0-9]+):([A-Za-z$0-9]+)"')
+
+
+def _scan_merged_cells(stream, chunk_size=1024 * 1024):
+    """ find the merge cells of a sheet xml stream
+    :return: list of (first row, last row+1, first col, last col+1)
+    """
+    from xlrd.xlsx import cell_name_to_rowx_colx
+
+    merged_cells = []
+    tail = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            return merged_cells
+        data = tail + chunk
+        end = 0
+        for match in _MERGE_CELL_REF.finditer(data):
+            first_rowx, first_colx = cell_name_to_rowx_colx(match.group(1).decode('ascii').replace('$', ''))
+            last_rowx, last_colx = cell_name_to_rowx_colx(match.group(2).decode('ascii').replace('$', ''))
+            merged_cells.append((first_rowx, last_rowx + 1, first_colx, last_colx + 1))
+            end = match.end()
+        # keep enough to complete a merge cell cut by the chunk end
+        tail = data[max(end, len(data) - 256):]
+
+
+class StreamSheet(object):
+    """a xlsx sheet read row by row from the zip, only the rows scanned to find the
+    header are kept, so memory does not grow with the sheet. It can be read once,
+    use `iter_rows` for the data rows after the header is found with `row`
+    """
+
+    def __init__(self, workbook, index):
+        self.book = workbook.book
+        self.name = workbook.names[index]
+        self.number = index
+        # xlrd pad all rows to the widest row, the sheet dimension tell the width up front
+        self.ncols = 0
+        self._merged_cells = None
+        self._workbook = workbook
+        self._rows = self._read_rows()
+        self._buffer = []
+
+    def _read_rows(self):
+        """ yield (row index, values, types) for every row up to the last row which has
+        a cell, rows without cells are yielded empty
+        """
+        from xml.etree.ElementTree import iterparse
+        from xlrd import xlsx
+
+        collector = _RowCollector(self.book)
+        x12sheet = xlsx.X12Sheet(collector)
+        row_tag = xlsx.U_SSML12 + 'row'
+        data_tag = xlsx.U_SSML12 + 'sheetData'
+        dimension_tag = xlsx.U_SSML12 + 'dimension'
+        next_rowx = 0
+        sheet_data = None
+        with self._workbook.open_sheet_stream(self.number) as stream:
+            for event, elem in iterparse(stream, events=('start', 'end')):
+                if event == 'start':
+                    if elem.tag == data_tag:
+                        sheet_data = elem
+                elif elem.tag == row_tag:
+                    x12sheet.do_row(elem)
+                    # drop the parsed rows so the tree does not grow
+                    sheet_data.clear()
+                    if not collector.cells:
+                        continue
+                    width = max(cell[0] for cell in collector.cells) + 1
+                    values = [''] * width
+                    types = [XL_CELL_EMPTY] * width
+                    for colx, ctype, value in collector.cells:
+                        values[colx] = value
+                        types[colx] = ctype
+                    collector.cells = []
+                    self.ncols = max(self.ncols, width)
+                    for rowx in range(next_rowx, x12sheet.rowx):
+                        yield rowx, [], []
+                    next_rowx = x12sheet.rowx + 1
+                    yield x12sheet.rowx, values, types
+                elif elem.tag == dimension_tag:
+                    ref = elem.get('ref')
+                    if ref:
+                        colx = xlsx.cell_name_to_rowx_colx(ref.split(':')[-1], allow_no_col=True)[1]
+                        if colx is not None:
+                            self.ncols = max(self.ncols, colx + 1)
+
+    @property
+    def merged_cells(self):
+        """merged ranges like xlrd, the merge cells are at the end of the sheet xml, so they
+        are found by a text scan of the xml which is much cheaper than parsing it
+        """
+        if self._merged_cells is None:
+            with self._workbook.open_sheet_stream(self.number) as stream:
+                self._merged_cells = _scan_merged_cells(stream)
+        return self._merged_cells
+
+    def _buffered(self, rowx):
+        while len(self._buffer) <= rowx:
+            try:
+                self._buffer.append(next(self._rows)[1:])
+            except StopIteration:
+                raise IndexError('row index {} out of range'.format(rowx))
+        return self._buffer[rowx]
+
+    def _pad(self, row, start_colx, end_colx, fill):
+        end_colx = self.ncols if end_colx is None else end_colx
+        row = row[start_colx:end_colx]
+        return row + [fill] * (end_colx - start_colx - len(row))
+
+    def row_len(self, rowx):
+        return len(self._buffered(rowx)[0])
+
+    def row_values(self, rowx, start_colx=0, end_colx=None):
+        return self._pad(self._buffered(rowx)[0], start_colx, end_colx, '')
+
+    def row_types(self, rowx, start_colx=0, end_colx=None):
+        return self._pad(self._buffered(rowx)[1], start_colx, end_colx, XL_CELL_EMPTY)
+
+    def row(self, rowx):
+        from xlrd.sheet import Cell
+        return [Cell(ctype, value) for value, ctype in zip(self.row_values(rowx), self.row_types(rowx))]
+
+    def iter_rows(self, start_row, start_col, end_col):
+        """ yield (row index, values, types) of the rows from start_row, values and types
+        are the cells in [start_col, end_col), the rows are read only once
+        """
+        buffer, self._buffer = self._buffer, []
+        for rowx in range(start_row, len(buffer)):
+            values, types = buffer[rowx]
+            yield rowx, self._pad(values, start_col, end_col, ''), self._pad(types, start_col, end_col, XL_CELL_EMPTY)
+        del buffer
+        for rowx, values, types in self._rows:
+            if rowx >= start_row:
+                yield rowx, self._pad(values, start_col, end_col, ''), self._pad(types, start_col, end_col, XL_CELL_EMPTY)
+
+
+class StreamWorkbook(Workbook):
+    """xlsx workbook whose sheets are read row by row with bounded memory, a sheet is
+    read again each time it is asked for
+    """
+
+    # the size of the file does not matter
+    MAX_FILE_SIZE = None
+
+    def __init__(self, path, file_contents=None):
+        super(StreamWorkbook, self).__init__(path, file_contents)
+        if self._zip is None:
+            self.book.release_resources()
+            raise ValueError('stream reader only read xlsx file: {}'.format(path))
+
+    def open_sheet_stream(self, index):
+        return self._zip.open(self._component_names[self._sheet_targets[index]])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(len(self))[index]]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('sheet index {} out of range'.format(index))
+        return StreamSheet(self, index)
+
+    def sheet_loaded(self, name_or_index):
+        return False
+
+    def unload_sheet(self, name_or_index):
+        pass
+
+
+# workbook readers by name
+READERS = {
+    'xlrd': Workbook,
+    'stream': StreamWorkbook,
+}
+
+
+class WorkbookCache(object):
+    """keep the opened workbooks, a workbook is keyed by its path, mtime and size, so
+    a file changed on disk is opened again
+    """
+
+    def __init__(self):
+        self._books = {}
+
+    def get(self, path, reader='xlrd'):
+        stat = os.stat(path)
+        path = abspath(path)
+        key = (path, stat.st_mtime, stat.st_size, reader)
+        book = self._books.get(key)
+        if book is None:
+            for old_key in [k for k in self._books if k[0] == path and k[3] == reader]:
+                self._books.pop(old_key).release_resources()
+            book = self._books[key] = get_reader(reader)(path)
+        return book
+
+    def clear(self):
+        for book in self._books.values():
+            book.release_resources()
+        self._books.clear()
+
+
+def get_reader(reader):
+    """
+    :param reader: reader name, one of READERS keys
+    :return: workbook class of the reader
+    """
+    try:
+        return READERS[reader]
+    except KeyError:
+        raise ValueError('reader should be one of {} but you give {}'.format(sorted(READERS), reader))
+
+
+def open_workbook(path, cache=None, reader='xlrd', file_contents=None):
+    """
+    :param path: excel file path
+    :param cache: WorkbookCache, if given the workbook is opened only once
+    :param reader: reader name, one of READERS keys
+    :param file_contents: the excel file content bytes, such a workbook is not cached
+    :return: Workbook
+    """
+    if cache is None or file_contents is not None:
+        return get_reader(reader)(path, file_contents)
+    return cache.get(path, reader)
+
+
+def get_sheets(path, cache=None, reader='xlrd', file_contents=None):
+    return open_workbook(path, cache, reader, file_contents)
+
+
+def get_sheet_names(file_name, cache=None, reader='xlrd'):
+    return _SheetNames(open_workbook(file_name, cache, reader))
 
 current_path = abspath(dirname(__file__))
 
@@ -25,5 +460,5 @@ def clear_json_files():
     for dir_path, dir_names, file_names in os.walk(get_data_path('.')):
         for file_name in file_names:
             name_partitioin = file_name.rpartition('.')
-            if name_partitioin[2] == 'json':
-                os.remove(get_data_path(file_name))
\ No newline at end of file
+            if name_partitioin[2] in ('json', 'ndjson'):
+                os.remove(get_data_path(file_name))
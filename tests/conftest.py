@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+
+def pytest_addoption(parser):
+    parser.addoption('--benchmark', action='store_true', default=False,
+                     help='run the benchmarks, they are slow and skipped by default')
+    parser.addoption('--benchmark-save', action='store_true', default=False,
+                     help='save the throughput benchmark results as the new baseline')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'benchmark: slow benchmark, only run with --benchmark')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--benchmark') or config.getoption('--benchmark-save'):
+        return
+    skip = pytest.mark.skip(reason='need --benchmark option to run')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""synthetic sheets for the benchmarks, built straight in memory so the
+timings are not dominated by parsing a workbook file
+"""
+from __future__ import unicode_literals
+
+import random
+import sys
+from array import array
+
+from xlrd import XL_CELL_DATE, XL_CELL_EMPTY, XL_CELL_NUMBER, XL_CELL_TEXT
+from xlrd.book import Book
+from xlrd.sheet import Sheet
+
+
+def make_sheet(rows, cols, date_ratio=0.0, blank_ratio=0.0, seed=0, top=0, left=0):
+    """ build a xlrd sheet with a header row and `rows` data rows
+    :param rows: data row count, the header row is not included
+    :param cols: column count
+    :param date_ratio: part of the columns holding date cells
+    :param blank_ratio: part of the data cells left empty
+    :param seed: random seed, same arguments always build the same sheet
+    :param top: blank rows above the header row
+    :param left: blank columns left of the table
+    :return: xlrd.sheet.Sheet
+    """
+    rand = random.Random(seed)
+    date_cols = set(range(int(cols * date_ratio)))
+
+    values = [['header{}'.format(i) for i in range(cols)]]
+    types = [array('B', [XL_CELL_TEXT] * cols)]
+    for row in range(rows):
+        row_values = []
+        row_types = []
+        for col in range(cols):
+            if blank_ratio and rand.random() < blank_ratio:
+                row_values.append('')
+                row_types.append(XL_CELL_EMPTY)
+            elif col in date_cols:
+                row_values.append(float(42000 + rand.randrange(400)))
+                row_types.append(XL_CELL_DATE)
+            elif col % 2:
+                row_values.append(float(row * cols + col))
+                row_types.append(XL_CELL_NUMBER)
+            else:
+                row_values.append(' text {} '.format(row * cols + col))
+                row_types.append(XL_CELL_TEXT)
+        values.append(row_values)
+        types.append(array('B', row_types))
+
+    if top or left:
+        values = [[''] * (left + cols) for _ in range(top)] + [[''] * left + row for row in values]
+        types = [array('B', [XL_CELL_EMPTY] * (left + cols)) for _ in range(top)] + \
+            [array('B', [XL_CELL_EMPTY] * left) + row for row in types]
+
+    book = Book()
+    book.logfile = sys.stdout
+    book.verbosity = 0
+    book.formatting_info = False
+    book.ragged_rows = False
+    book._sheet_visibility = [0]
+    sheet = Sheet(book, position=None, name='synthetic', number=0)
+    sheet._cell_values = values
+    sheet._cell_types = types
+    sheet.nrows = top + rows + 1
+    sheet.ncols = left + cols
+    return sheet
+
+
+def make_rows(rows, cols, date_ratio=0.0, blank_ratio=0.0, merged_ratio=0.0, seed=0):
+    """ rows of a workbook sheet for write_xlsx, a header row and `rows` data rows
+    :param rows: data row count, the header row is not included
+    :param cols: column count
+    :param date_ratio: part of the columns holding dates
+    :param blank_ratio: part of the data rows left empty
+    :param merged_ratio: part of the data rows starting a merged range of 2 to 4 rows down
+           a random column, the cells under the first one are empty
+    :param seed: random seed, same arguments always build the same rows
+    :return: (rows, merged cells), same as the items of write_xlsx sheets
+    """
+    from datetime import date, timedelta
+
+    rand = random.Random(seed)
+    date_cols = set(range(int(cols * date_ratio)))
+    first_day = date(2015, 1, 1)
+
+    values = [['header{}'.format(i) for i in range(cols)]]
+    for row in range(rows):
+        if blank_ratio and rand.random() < blank_ratio:
+            values.append([None] * cols)
+            continue
+        values.append([first_day + timedelta(days=rand.randrange(400)) if col in date_cols else
+                       float(row * cols + col) if col % 2 else
+                       'text {}'.format(row * cols + col)
+                       for col in range(cols)])
+
+    merged = []
+    # the first row not merged yet of each column
+    free = [1] * cols
+    for row in range(1, rows + 1):
+        if not merged_ratio or rand.random() >= merged_ratio or values[row][0] is None:
+            continue
+        col = rand.randrange(cols)
+        last = min(row + rand.randrange(1, 4), rows)
+        if row < free[col] or last == row:
+            continue
+        for below in range(row + 1, last + 1):
+            values[below][col] = None
+        merged.append((row, last, col, col))
+        free[col] = last + 1
+    return values, merged
+
+
+def _col_name(col):
+    name = ''
+    col += 1
+    while col:
+        col, rest = divmod(col - 1, 26)
+        name = chr(ord('A') + rest) + name
+    return name
+
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '{}'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '<Override PartName="/xl/sharedStrings.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+    '</Types>')
+
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>')
+
+# cell style 1 is a built in date format
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="1"><fill><patternFill patternType="none"/></fill></fills>'
+    '<borders count="1"><border/></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '</styleSheet>')
+
+_NS = ('xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+       'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships"')
+
+
+def write_xlsx(path, sheets, date1904=False):
+    """ write a minimal xlsx workbook
+    :param path: xlsx file path
+    :param sheets: list of (name, rows) or (name, rows, merged_cells), rows is a list of
+           lists, a cell is a str, a number, a datetime.date or None for an empty cell,
+           merged_cells is a list of (first_row, last_row, first_col, last_col), last ones
+           inclusive
+    :param date1904: workbook use the 1904 date system
+    """
+    import zipfile
+    from datetime import date, datetime
+
+    epoch = datetime(1904, 1, 1) if date1904 else datetime(1899, 12, 30)
+    strings = {}
+
+    def cell_xml(row, col, value):
+        ref = '{}{}'.format(_col_name(col), row + 1)
+        if isinstance(value, date):
+            if not isinstance(value, datetime):
+                value = datetime(value.year, value.month, value.day)
+            serial = (value - epoch).total_seconds() / 86400.0
+            return '<c r="{}" s="1"><v>{!r}</v></c>'.format(ref, serial)
+        if isinstance(value, (int, float)):
+            return '<c r="{}"><v>{!r}</v></c>'.format(ref, value)
+        index = strings.setdefault(value, len(strings))
+        return '<c r="{}" t="s"><v>{}</v></c>'.format(ref, index)
+
+    def sheet_xml(rows, merged):
+        parts = ['<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n<worksheet {}><sheetData>'.format(_NS)]
+        for row, values in enumerate(rows):
+            cells = ''.join(cell_xml(row, col, value) for col, value in enumerate(values) if value is not None)
+            if cells:
+                parts.append('<row r="{}">{}</row>'.format(row + 1, cells))
+        parts.append('</sheetData>')
+        if merged:
+            parts.append('<mergeCells count="{}">'.format(len(merged)))
+            for first_row, last_row, first_col, last_col in merged:
+                parts.append('<mergeCell ref="{}{}:{}{}"/>'.format(
+                    _col_name(first_col), first_row + 1, _col_name(last_col), last_row + 1))
+            parts.append('</mergeCells>')
+        parts.append('</worksheet>')
+        return ''.join(parts)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        sheet_entries = []
+        rel_entries = []
+        type_entries = []
+        for number, sheet in enumerate(sheets, 1):
+            name, rows = sheet[0], sheet[1]
+            merged = sheet[2] if len(sheet) > 2 else None
+            zf.writestr('xl/worksheets/sheet{}.xml'.format(number), sheet_xml(rows, merged).encode('utf-8'))
+            sheet_entries.append('<sheet name="{}" sheetId="{}" r:id="rId{}"/>'.format(_escape(name), number, number))
+            rel_entries.append(
+                '<Relationship Id="rId{0}" '
+                'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                'Target="worksheets/sheet{0}.xml"/>'.format(number))
+            type_entries.append(
+                '<Override PartName="/xl/worksheets/sheet{}.xml" '
+                'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'.format(
+                    number))
+        number = len(sheets)
+        rel_entries.append(
+            '<Relationship Id="rId{}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+            'Target="styles.xml"/>'.format(number + 1))
+        rel_entries.append(
+            '<Relationship Id="rId{}" '
+            'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings" '
+            'Target="sharedStrings.xml"/>'.format(number + 2))
+
+        zf.writestr('[Content_Types].xml', _CONTENT_TYPES.format(''.join(type_entries)))
+        zf.writestr('_rels/.rels', _ROOT_RELS)
+        zf.writestr('xl/workbook.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<workbook {}><workbookPr{}/><sheets>{}</sheets></workbook>'.format(
+                _NS, ' date1904="1"' if date1904 else '', ''.join(sheet_entries))).encode('utf-8'))
+        zf.writestr('xl/_rels/workbook.xml.rels', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+            '{}</Relationships>'.format(''.join(rel_entries))))
+        zf.writestr('xl/styles.xml', _STYLES)
+        shared = sorted(strings, key=strings.get)
+        zf.writestr('xl/sharedStrings.xml', (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" count="{0}" uniqueCount="{0}">'
+            '{1}</sst>'.format(len(shared), ''.join(
+                '<si><t xml:space="preserve">{}</t></si>'.format(_escape(text)) for text in shared))).encode('utf-8'))
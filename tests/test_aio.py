@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+from exceltojson import aio
+from exceltojson.excel2json import iter_rows, open
+from exceltojson.utils import get_data_path
+from tests.synthetic import make_rows, write_xlsx
+
+
+def test_convert(tmp_path):
+    path = get_data_path('test_excel_process.xlsx')
+    convert = aio.convert(path, str(tmp_path), 5, index_sheets={2: None}, patch_sheet_alias=False)
+    report = asyncio.run(convert)
+    assert report['converted'] == [2]
+    with open(str(tmp_path / 'sheet-2.json'), encoding='utf-8') as f:
+        assert {int(row): data for row, data in json.load(f).items()} == dict(list(iter_rows(path, 2))[:5])
+
+
+def test_convert_cancelled(tmp_path):
+    path = str(tmp_path / 'book.xlsx')
+    rows, merged = make_rows(20000, 5)
+    write_xlsx(path, [('Sheet1', rows, merged)])
+    out = tmp_path / 'out'
+    out.mkdir()
+
+    async def cancel():
+        task = asyncio.ensure_future(aio.convert(path, str(out), 1000, executor=executor))
+        while not os.path.exists(str(out / 'sheet-0.json')):
+            await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    with ThreadPoolExecutor(1) as executor:
+        asyncio.run(cancel())
+    # the conversion stopped before the last chunk and its manifest
+    assert not os.path.exists(str(out / 'sheet-0.manifest.json'))
+    assert not os.path.exists(str(out / 'sheet-0.part00019.json'))
+    # the chunk being written when it stopped is not published and its temp file is removed
+    names = os.listdir(str(out))
+    assert not [name for name in names if name.endswith('.tmp')]
+    for name in names:
+        with open(str(out / name), encoding='utf-8') as f:
+            assert len(json.load(f)) == 1000
+
+
+def test_aiter_rows():
+    path = get_data_path('test_excel_process.xlsx')
+
+    async def collect(sheet=2, **kwargs):
+        return [item async for item in aio.aiter_rows(path, sheet, **kwargs)]
+
+    assert asyncio.run(collect(queue_size=2)) == list(iter_rows(path, 2))
+    assert asyncio.run(collect(as_tuple=True)) == list(iter_rows(path, 2, as_tuple=True))
+    with pytest.raises(ValueError):
+        asyncio.run(collect('no such sheet'))
+
+
+def test_aiter_rows_backpressure_and_close(monkeypatch):
+    produced = []
+    finished = threading.Event()
+
+    def counted_rows(*args, **kwargs):
+        try:
+            for row in range(1000):
+                produced.append(row)
+                yield row, {}
+        finally:
+            finished.set()
+
+    monkeypatch.setattr('exceltojson.excel2json.iter_rows', counted_rows)
+
+    async def take_two():
+        rows = aio.aiter_rows('book.xlsx', queue_size=3)
+        taken = [await rows.__anext__(), await rows.__anext__()]
+        await asyncio.sleep(0.1)
+        # the converter wait for the consumer once the queue is full
+        assert len(produced) <= len(taken) + 3 + 1
+        await rows.aclose()
+        return taken
+
+    assert asyncio.run(take_two()) == [(0, {}), (1, {})]
+    assert finished.wait(5)
+    assert len(produced) < 10
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import json
+import os
+
+import pytest
+
+from exceltojson.batch import convert_batch, find_workbooks, is_batch_source
+from exceltojson.stats import ConvertStats
+from tests.synthetic import write_xlsx
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = tmp_path / 'in'
+    (root / 'a').mkdir(parents=True)
+    rows = [['header'], ['content1'], ['content2']]
+    write_xlsx(str(root / 'one.xlsx'), [('Sheet1', rows)])
+    write_xlsx(str(root / 'a' / 'two.xlsx'), [('Sheet1', rows), ('Sheet2', rows[:2])])
+    (root / 'a' / 'bad.xlsx').write_bytes(b'not a workbook')
+    (root / 'a' / 'notes.txt').write_bytes(b'not a workbook')
+    return root
+
+
+def test_find_workbooks(source):
+    assert find_workbooks(str(source)) == (str(source), [os.path.join('a', 'bad.xlsx'),
+                                                         os.path.join('a', 'two.xlsx'), 'one.xlsx'])
+    assert find_workbooks(str(source / 'a' / 't*.xlsx')) == (str(source / 'a'), ['two.xlsx'])
+    assert is_batch_source(str(source))
+    assert is_batch_source(str(source / '*.xlsx'))
+    assert not is_batch_source(str(source / 'one.xlsx'))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_convert_batch(source, tmp_path, workers):
+    out = tmp_path / 'out'
+    out.mkdir()
+    report = convert_batch(str(source), str(out), workers=workers, show_row=False)
+
+    entries = {entry['source']: entry for entry in report['files']}
+    assert [entries[name]['status'] for name in sorted(entries)] == ['error', 'ok', 'ok']
+    assert entries[os.path.join('a', 'bad.xlsx')]['error']
+    assert entries[os.path.join('a', 'two.xlsx')]['rows'] == 3
+    assert entries[os.path.join('a', 'two.xlsx')]['sheets'] == 2
+    assert (report['converted'], report['failed'], report['rows']) == (2, 1, 5)
+    assert report['bytes'] == sum(entry['bytes'] for entry in report['files'])
+
+    # the output tree mirror the source tree
+    with open(str(out / 'a' / 'two.xlsx' / 'sheet-1.json')) as f:
+        assert json.load(f) == [{'header': 'content1'}]
+    assert os.path.exists(str(out / 'one.xlsx' / 'sheet-0.json'))
+    with open(str(out / 'batch-report.json')) as f:
+        assert json.load(f)['files'] == report['files']
+    assert entries['one.xlsx']['stats'] is None
+
+    # the stats of each workbook
+    report = convert_batch(str(source), str(out), workers=workers, show_row=False, stats=True)
+    entries = {entry['source']: entry for entry in report['files']}
+    assert entries[os.path.join('a', 'bad.xlsx')]['stats'] is None
+    stats = ConvertStats.from_dict(entries[os.path.join('a', 'two.xlsx')]['stats'])
+    assert {name: sheet.rows for name, sheet in stats.sheets.items()} == {0: 2, 1: 1}
+    assert len(stats.format().splitlines()) == 4
+
+
+def test_convert_batch_same_stem(tmp_path):
+    root = tmp_path / 'in'
+    root.mkdir()
+    write_xlsx(str(root / 'r.xlsx'), [('Sheet1', [['header'], ['xlsx']])])
+    write_xlsx(str(root / 'r.XLSX'), [('Sheet1', [['header'], ['XLSX']])])
+    out = tmp_path / 'out'
+    out.mkdir()
+    assert convert_batch(str(root), str(out), show_row=False)['converted'] == 2
+
+    # the workbooks with the same name but the suffix do not overwrite each other
+    for name in ['r.xlsx', 'r.XLSX']:
+        with open(str(out / name / 'sheet-0.json')) as f:
+            assert json.load(f) == [{'header': name.split('.')[1]}]
@@ -0,0 +1,360 @@
+# -*- coding: utf-8 -*-
+"""benchmarks, run them with `py.test tests --benchmark -s`
+"""
+from __future__ import unicode_literals, print_function
+
+import json
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+import pytest
+from xlrd import XL_CELL_DATE
+from xlrd.xldate import xldate_as_datetime
+
+from exceltojson.excel2json import _RowProcess, _SheetProcess, _JsonWriter, ProcessExcel
+from exceltojson.utils import get_sheets
+from tests.synthetic import make_sheet, write_xlsx
+
+pytestmark = pytest.mark.benchmark
+
+
+def _timeit(func, *args):
+    start = time.time()
+    ret = func(*args)
+    return time.time() - start, ret
+
+
+def _report(name, old, new):
+    print('\n{}: before {:.3f}s, after {:.3f}s, speedup {:.1f}x'.format(name, old, new, old / new))
+
+
+def _peak_memory(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _legacy_rows(sheet, keys, col, date_mode):
+    """the row conversion before rows were read once, call sheet.row() for every column"""
+    result = []
+    for row in range(1, sheet.nrows):
+        row_dict = {}
+        for index, key in enumerate(keys):
+            cell = sheet.row(row)[col + index]
+            if cell.ctype is XL_CELL_DATE:
+                row_dict[key] = xldate_as_datetime(cell.value, date_mode).strftime('%Y/%m/%d')
+            else:
+                row_dict[key] = str(cell.value).strip()
+        result.append(row_dict)
+    return result
+
+
+def test_row_process_wide_sheet():
+    # 10000 rows, not 50000: the legacy path build a row list for every cell and already take
+    # about 40s on 10000x80, the speedup does not depend on the row count
+    sheet = make_sheet(10000, 80, date_ratio=0.1)
+    keys = sheet.row_values(0)
+
+    def convert():
+        row_process = _RowProcess(sheet, keys, 0)
+        return [row_process(row) for row in range(1, sheet.nrows)]
+
+    old, expected = _timeit(_legacy_rows, sheet, keys, 0, 0)
+    new, result = _timeit(convert)
+    _report('row process 10000x80', old, new)
+    assert result == expected
+    assert new < old
+
+
+def test_json_writer_memory(tmp_path):
+    sheet = make_sheet(100000, 20)
+    sheet_process = _SheetProcess(sheet, merge_cell=False)
+    old_file = str(tmp_path / 'old.json')
+    new_file = str(tmp_path / 'new.json')
+
+    def legacy_write():
+        """collect the whole chunk then json.dumps it, as _write_json did"""
+        data = {}
+        for row, content in sheet_process():
+            data[row] = content
+        with open(old_file, 'w') as f:
+            f.write(json.dumps(data))
+
+    def stream_write():
+        writer = _JsonWriter(new_file, dict)
+        for row, content in sheet_process():
+            writer.add_data(row, content)
+        writer.close()
+
+    old = _peak_memory(legacy_write)
+    new = _peak_memory(stream_write)
+    print('\njson writer 100000x20 peak memory: before {:.1f}MB, after {:.1f}MB'.format(
+        old / 1024.0 / 1024, new / 1024.0 / 1024))
+    with open(old_file) as f_old, open(new_file) as f_new:
+        assert f_old.read() == f_new.read()
+    assert new * 10 < old
+
+
+_MEASURE = """
+import resource, sys, time
+start = time.time()
+{}
+seconds = time.time() - start
+# ru_maxrss is kept across exec, so it can be the peak of pytest which started this
+# process, VmHWM is the peak of this process alone
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+try:
+    with open('/proc/self/status') as f:
+        rss = [int(line.split()[1]) for line in f if line.startswith('VmHWM:')][0]
+except IOError:
+    pass
+print(seconds, rss)
+"""
+
+
+def _measure_in_process(code):
+    """run code in a fresh interpreter, return its run time and peak rss in KB"""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', _MEASURE.format(code)], cwd=root)
+    seconds, rss = output.split()
+    return float(seconds), int(rss)
+
+
+def test_pick_one_sheet_of_thirty(tmp_path):
+    path = str(tmp_path / 'thirty.xlsx')
+    rows = [['header{}'.format(col) for col in range(20)]]
+    rows += [['text {}'.format(row * 20 + col) if col % 2 else row * 20 + col for col in range(20)]
+             for row in range(3000)]
+    write_xlsx(path, [('sheet{}'.format(i), rows) for i in range(30)])
+
+    old_time, old_rss = _measure_in_process(
+        'import xlrd\nxlrd.open_workbook({!r}).sheet_by_index(3)'.format(path))
+    new_time, new_rss = _measure_in_process(
+        'from exceltojson.utils import Workbook\nWorkbook({!r})[3]'.format(path))
+    _report('pick 1 of 30 sheets', old_time, new_time)
+    print('pick 1 of 30 sheets peak rss: before {}MB, after {}MB'.format(old_rss // 1024, new_rss // 1024))
+    assert new_time < old_time
+    assert new_rss < old_rss
+
+
+def test_stream_reader_memory(tmp_path):
+    path = str(tmp_path / 'long.xlsx')
+    rows = [['header{}'.format(col) for col in range(10)]]
+    rows += [['text {}'.format(row) if col % 2 else row * 10 + col for col in range(10)] for row in range(50000)]
+    write_xlsx(path, [('long', rows)])
+    del rows
+
+    def convert(reader):
+        for _ in _SheetProcess(get_sheets(path, reader=reader)[0])():
+            pass
+
+    old = _peak_memory(convert, 'xlrd')
+    new = _peak_memory(convert, 'stream')
+    print('\nreader 50000x10 peak memory: xlrd {:.1f}MB, stream {:.1f}MB'.format(
+        old / 1024.0 / 1024, new / 1024.0 / 1024))
+    assert new * 2 < old
+
+
+def test_numpy_engine_million_rows():
+    pytest.importorskip('numpy')
+    sheet = make_sheet(1000000, 8, date_ratio=0.25, blank_ratio=0.1)
+
+    def convert(engine):
+        # rows are dropped as they come, like the json writer does
+        for _ in _SheetProcess(sheet, merge_cell=True, engine=engine)():
+            pass
+
+    # best of two runs of each engine taken in turns, a single run is too noisy to compare
+    times = {'row': [], 'numpy': []}
+    for _ in range(2):
+        for engine in ('row', 'numpy'):
+            times[engine].append(_timeit(convert, engine)[0])
+    old, new = min(times['row']), min(times['numpy'])
+    _report('numpy engine 1000000x8', old, new)
+    assert new < old
+
+    sample = make_sheet(50000, 8, date_ratio=0.25, blank_ratio=0.1)
+    assert (list(_SheetProcess(sample, engine='numpy')()) ==
+            list(_SheetProcess(sample, engine='row')()))
+
+
+def test_merge_cell_fill():
+    from tests.test_excel_2_json import _legacy_merge_rows
+
+    sheet = make_sheet(200000, 20, blank_ratio=0.3)
+    sheet_process = _SheetProcess(sheet, merge_cell=True)
+    keys = sheet_process.headers
+    # the cell conversion is the same before and after, time the fill stage alone
+    rows = [sheet_process.row_process.texts(sheet.row_values(row), sheet.row_types(row))
+            for row in range(1, sheet.nrows)]
+
+    def legacy_fill():
+        content_bak = {}
+        for values in rows:
+            content = dict(zip(keys, values))
+            for key in keys:
+                if not content[key]:
+                    content[key] = content_bak.get(key, '')
+            content_bak = content.copy()
+
+    def row_fill():
+        forward_fill = sheet_process.merge_fill()
+        for row, values in enumerate(rows):
+            dict(zip(keys, forward_fill(row, values)))
+
+    old, _ = _timeit(legacy_fill)
+    new, _ = _timeit(row_fill)
+    _report('merge cell row fill 200000x20', old, new)
+
+    np = pytest.importorskip('numpy')
+    from exceltojson.columnar import _fill_column
+
+    columns = [list(column) for column in zip(*rows)]
+    non_empty = [np.array([bool(value) for value in column]) for column in columns]
+
+    def batch_fill():
+        for column, column_non_empty in zip(columns, non_empty):
+            _fill_column(column, column_non_empty, '')
+
+    batch, _ = _timeit(batch_fill)
+    _report('merge cell batch fill 200000x20', old, batch)
+    assert batch < old
+
+    sample = _SheetProcess(make_sheet(20000, 20, blank_ratio=0.3), merge_cell=True)
+    assert list(sample()) == list(_legacy_merge_rows(sample))
+
+
+def _legacy_header(sheet):
+    """the header search before the header locator, cell by cell through sheet.row()"""
+    for i in range(500):
+        row = sheet.row(i)
+        if any(row[j].value.strip() for j in range(len(row))):
+            start_row = i
+            break
+    for j in range(1000):
+        if sheet.row(start_row)[j].value.strip():
+            start_col = j
+            break
+    row = sheet.row(start_row)
+    return start_row, start_col, [row[j].value.strip() for j in range(start_col, len(row))]
+
+
+def test_header_locator_blank_preamble_wide_header():
+    sheet = make_sheet(10, 2000, top=450, left=900)
+
+    def locate():
+        sheet_process = _SheetProcess(sheet, merge_cell=False)
+        return sheet_process.start_row, sheet_process.start_col, sheet_process.headers
+
+    old, expected = _timeit(_legacy_header, sheet)
+    new, result = _timeit(locate)
+    _report('header locator 450 blank rows, 900 blank columns, 2000 headers', old, new)
+    assert result == expected
+    assert new * 10 < old
+
+
+def test_background_write_slow_disk(tmp_path, monkeypatch):
+    from exceltojson.excel2json import _BackgroundWriter, _FileSink
+
+    sheet = make_sheet(100000, 20, date_ratio=0.1)
+    # a disk writing 20MB/s which take 20ms for a fsync, the time is taken as the file buffer
+    # is flushed
+    write = _FileSink.write
+
+    def slow_write(self, data):
+        self.pending = getattr(self, 'pending', 0) + len(data)
+        if self.pending >= _FileSink.BUFFER_SIZE:
+            time.sleep(self.pending / 20e6)
+            self.pending = 0
+        write(self, data)
+
+    def slow_fsync(fd):
+        time.sleep(0.02)
+
+    monkeypatch.setattr(_FileSink, 'write', slow_write)
+    monkeypatch.setattr(os, 'fsync', slow_fsync)
+
+    def convert(background, out):
+        """ the loop of ProcessExcel._write_json, 10000 rows for each file
+        """
+        writer = None
+        for row, data in _SheetProcess(sheet)():
+            if writer is None or writer.rows >= 10000:
+                if writer is not None:
+                    writer.close()
+                writer = _JsonWriter(str(tmp_path / '{}-{}.json'.format(out, row)), dict, None, background, True)
+            writer.add_data(row, data)
+        writer.close()
+        if background is not None:
+            background.close()
+
+    old, _ = _timeit(convert, None, 'serial')
+    new, _ = _timeit(convert, _BackgroundWriter(), 'background')
+    _report('background write 100000x20 on a slow disk', old, new)
+    for name in os.listdir(str(tmp_path)):
+        if name.startswith('serial'):
+            with open(str(tmp_path / name), 'rb') as f, open(str(tmp_path / name.replace('serial', 'background')),
+                                                              'rb') as g:
+                assert f.read() == g.read()
+    assert new < old
+
+
+def test_range_rows_one_large_sheet(tmp_path):
+    from tests.synthetic import make_rows
+
+    path = str(tmp_path / 'large.xlsx')
+    rows, merged = make_rows(100000, 10, date_ratio=0.2, blank_ratio=0.1)
+    write_xlsx(path, [('large', rows, merged)])
+    del rows
+    workers = min(os.cpu_count() or 1, 4)
+
+    def convert(out, **kwargs):
+        os.mkdir(str(tmp_path / out))
+        ProcessExcel(path, str(tmp_path / out), **kwargs)(max_row=10000)
+
+    old, _ = _timeit(convert, 'serial')
+    new, _ = _timeit(partial(convert, workers=workers, range_rows=10000), 'ranges')
+    _report('range rows 100000x10 with {} workers'.format(workers), old, new)
+    for name in os.listdir(str(tmp_path / 'serial')):
+        with open(str(tmp_path / 'serial' / name), 'rb') as f, open(str(tmp_path / 'ranges' / name), 'rb') as g:
+            assert f.read() == g.read()
+    if workers < 2:
+        pytest.skip('need more than one cpu to compare')
+    assert new < old
+
+
+def test_date_heavy_sheet():
+    from exceltojson.excel2json import _date_converter
+
+    sheet = make_sheet(100000, 10, date_ratio=0.8)
+    keys = sheet.row_values(0)
+
+    def legacy_convert():
+        """a datetime and a strftime for every date cell"""
+        result = []
+        for row in range(1, sheet.nrows):
+            values = sheet.row_values(row)
+            types = sheet.row_types(row)
+            result.append(dict(zip(keys, [
+                xldate_as_datetime(value, 0).strftime('%Y/%m/%d') if ctype == XL_CELL_DATE else str(value).strip()
+                for value, ctype in zip(values, types)])))
+        return result
+
+    def convert():
+        row_process = _RowProcess(sheet, keys, 0)
+        return [row_process(row) for row in range(1, sheet.nrows)]
+
+    _date_converter(0).cache_clear()
+    old, expected = _timeit(legacy_convert)
+    new, result = _timeit(convert)
+    _report('date heavy 100000x10', old, new)
+    print('date cache: {}'.format(_date_converter(0).cache_info()))
+    assert result == expected
+    assert new < old
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import os
+
+import pytest
+
+from exceltojson.excel2json import _SheetProcess
+from exceltojson.utils import get_sheets, get_data_path
+from tests.synthetic import make_sheet, write_xlsx
+
+pytest.importorskip('numpy')
+
+from exceltojson.columnar import columnar_rows
+
+
+def _rows(sheet, merge_cell, engine):
+    try:
+        return list(_SheetProcess(sheet, merge_cell=merge_cell, engine=engine)())
+    except ValueError as e:
+        return str(e)
+
+
+@pytest.mark.parametrize('merge_cell', [True, False])
+@pytest.mark.parametrize('name', sorted(name for name in os.listdir(get_data_path('.')) if name.endswith('.xlsx')))
+def test_numpy_engine_same_as_row_engine(name, merge_cell):
+    book = get_sheets(get_data_path(name))
+    for sheet in book:
+        assert _rows(sheet, merge_cell, 'numpy') == _rows(sheet, merge_cell, 'row')
+
+
+@pytest.mark.parametrize('merge_cell', [True, False])
+def test_numpy_engine_batches(merge_cell):
+    sheet = make_sheet(500, 6, date_ratio=0.5, blank_ratio=0.4, seed=1)
+    sheet_process = _SheetProcess(sheet, merge_cell=merge_cell)
+    # small batches carry the merge cell values across batches
+    assert list(columnar_rows(sheet_process, batch_rows=7)) == list(sheet_process())
+
+
+def test_unknown_engine():
+    with pytest.raises(ValueError):
+        _SheetProcess(make_sheet(1, 1), engine='unknown')
+
+
+def test_numpy_engine_merged_ranges(tmp_path):
+    from tests.test_excel_2_json import _write_merged_xlsx
+
+    path = str(tmp_path / 'merged.xlsx')
+    _write_merged_xlsx(path)
+    for reader in ('xlrd', 'stream'):
+        sheet = get_sheets(path, reader=reader)[0]
+        assert _rows(sheet, True, 'numpy') == list(_SheetProcess(get_sheets(path)[0])())
+
+
+@pytest.mark.parametrize('merge_cell', [True, False])
+def test_numpy_engine_mixed_columns(tmp_path, merge_cell):
+    import datetime
+
+    path = str(tmp_path / 'mixed.xlsx')
+    day = datetime.date(2016, 11, 16)
+    rows = [['date', 'number', 'text', 'mixed']]
+    rows += [[day if i % 3 else '', float(i) if i % 4 else '', ' text {} '.format(i) if i % 5 else '  ',
+              [day, 1.5, 2, ' a ', ''][i % 5]] for i in range(40)]
+    write_xlsx(path, [('Sheet1', rows)])
+    sheet = get_sheets(path)[0]
+    assert _rows(sheet, merge_cell, 'numpy') == _rows(sheet, merge_cell, 'row')
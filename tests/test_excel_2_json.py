@@ -2,15 +2,21 @@
 from __future__ import unicode_literals
 
 import os
+import sys
 import json
+import hashlib
+import datetime
+import threading
 
 from functools import partial
 
 import pytest
 
-from exceltojson.excel2json import (_RowProcess, _ColProcess, _SheetProcess, ProcessExcel)
+from exceltojson.excel2json import (_RowProcess, _ColProcess, _SheetProcess, _HeaderLocator, ProcessExcel,
+                                    _date_converter, _can_fork)
 from exceltojson.utils import (get_sheets, get_data_path, clear_json_files)
 from exceltojson.excel2json import open
+from tests.synthetic import make_rows, make_sheet, write_xlsx
 
 
 def test_row_process():
@@ -77,6 +83,25 @@ def test_time_cell_process():
     assert data[0][1] == {'time': '2016/11/16', 'header3': '内容2', 'header2': '内容3'}
 
 
+@pytest.mark.parametrize('engine', ['row', 'numpy'])
+def test_time_cell_date_format(engine):
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+    sheet = get_sheets(get_data_path('test_time_cell_process.xlsx'))[0]
+    sheet_process = _SheetProcess(sheet, engine=engine, date_format='%Y-%m-%d')
+    assert list(sheet_process())[0][1]['time'] == '2016-11-16'
+
+
+def test_date_converter_cache():
+    convert = _date_converter(0, '%d.%m.%Y')
+    convert.cache_clear()
+    assert [convert(day) for day in (42000.0, 42001.0, 42000.0, 42000.0)] == [
+        '27.12.2014', '28.12.2014', '27.12.2014', '27.12.2014']
+    assert convert.cache_info()[:2] == (2, 2)
+    assert _date_converter(0, '%d.%m.%Y') is convert
+    assert _date_converter(1, '%d.%m.%Y')(42000.0) == '28.12.2018'
+
+
 
 class TestProcessExcel:
 
@@ -104,14 +129,14 @@ class TestProcessExcel:
         excel = self.process_excel()
         # sheet small should not split
         excel(100)
-        assert os.path.exists(get_data_path('sheet-20.json')) is False
+        assert os.path.exists(get_data_path('sheet-2.part00001.json')) is False
 
         excel(max_row=5)
         # big excel file should be split
-        assert os.path.exists(get_data_path('sheet-20.json'))
+        assert os.path.exists(get_data_path('sheet-2.part00001.json'))
         assert os.path.exists(get_data_path('sheet-2.json'))
         # split file should be right json
-        with open(get_data_path('sheet-20.json'), encoding='utf-8') as f:
+        with open(get_data_path('sheet-2.part00001.json'), encoding='utf-8') as f:
             assert json.load(f) == {
                 '9': {
                     'header1': u'内容6',
@@ -137,6 +162,74 @@ class TestProcessExcel:
                 }
             }
 
+    def test_excel_process_manifest(self):
+        excel = self.process_excel()
+        excel(max_row=5)
+        with open(get_data_path('sheet-2.manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert manifest['sheet'] == 2
+        assert [chunk['file'] for chunk in manifest['chunks']] == ['sheet-2.json', 'sheet-2.part00001.json']
+        assert manifest['chunks'][1]['first_row'] == 9
+        assert manifest['chunks'][1]['last_row'] == 10
+        assert manifest['rows'] == sum(chunk['rows'] for chunk in manifest['chunks'])
+        for chunk in manifest['chunks']:
+            with open(get_data_path(chunk['file']), 'rb') as f:
+                data = f.read()
+            assert len(data) == chunk['bytes']
+            assert hashlib.sha256(data).hexdigest() == chunk['sha256']
+            assert len(json.loads(data.decode('utf-8'))) == chunk['rows']
+
+    def test_excel_process_with_max_bytes(self):
+        excel = self.process_excel()
+        excel(max_row=None, max_bytes=200)
+        with open(get_data_path('sheet-2.manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert len(manifest['chunks']) > 1
+        rows = {}
+        for chunk in manifest['chunks']:
+            assert chunk['bytes'] <= 200
+            with open(get_data_path(chunk['file']), encoding='utf-8') as f:
+                rows.update(json.load(f))
+        assert len(rows) == manifest['rows']
+
+        # a row larger than max_bytes is a file alone
+        excel(max_row=None, max_bytes=1)
+        with open(get_data_path('sheet-2.manifest.json'), encoding='utf-8') as f:
+            manifest = json.load(f)
+        assert [chunk['rows'] for chunk in manifest['chunks']] == [1] * manifest['rows']
+
+        # max_row is not capped when splitting by size
+        excel(max_row=10000000, max_bytes=1024 * 1024)
+        with pytest.raises(ValueError):
+            excel(max_row=10000000)
+        with pytest.raises(ValueError):
+            excel(max_row=None)
+        with pytest.raises(ValueError):
+            excel(max_bytes=0)
+
+    def test_excel_process_ndjson(self):
+        self.process_excel()(5)
+        self.process_excel(output_format='ndjson')(5)
+        with open(get_data_path('sheet-2.manifest.json'), encoding='utf-8') as f:
+            chunks = json.load(f)['chunks']
+        assert [chunk['file'] for chunk in chunks] == ['sheet-2.ndjson', 'sheet-2.part00001.ndjson']
+
+        for chunk in chunks:
+            with open(get_data_path(chunk['file']), encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            with open(get_data_path(chunk['file'].replace('.ndjson', '.json')), encoding='utf-8') as f:
+                expected = json.load(f)
+            assert len(lines) == chunk['rows']
+            rows = [json.loads(line) for line in lines]
+            assert {str(row.pop('_row')): row for row in rows} == expected
+
+        self.process_excel(output_format='ndjson', show_row=False)(5)
+        with open(get_data_path('sheet-2.part00001.ndjson'), encoding='utf-8') as f:
+            assert [json.loads(line) for line in f] == list(expected.values())
+
+        with pytest.raises(ValueError):
+            self.process_excel(output_format='xml')
+
     def test_excel_process_with_no_show_row(self):
         excel = self.process_excel(show_row=False)
         excel(10)
@@ -211,3 +304,469 @@ class TestProcessExcel:
             self.process_excel(show_row=False, name_sheets={'a': {
                 u'头部': 'header3'
             }}, patch_sheet_alias=True)
+
+    def test_excel_process_with_workers(self, tmp_path):
+        serial_dir = tmp_path / 'serial'
+        parallel_dir = tmp_path / 'parallel'
+        serial_dir.mkdir()
+        parallel_dir.mkdir()
+        ProcessExcel(get_data_path('test_excel_process.xlsx'), str(serial_dir))(5)
+        ProcessExcel(get_data_path('test_excel_process.xlsx'), str(parallel_dir), workers=3)(5)
+
+        names = sorted(os.listdir(str(serial_dir)))
+        assert names == sorted(os.listdir(str(parallel_dir)))
+        for name in names:
+            assert (serial_dir / name).read_bytes() == (parallel_dir / name).read_bytes()
+
+    def test_excel_process_with_workers_error(self, tmp_path):
+        # sheet 1 json file can not be written, the error of the worker keep its type
+        (tmp_path / 'sheet-1.json').mkdir()
+        excel = ProcessExcel(get_data_path('test_excel_process.xlsx'), str(tmp_path), workers=2)
+        with pytest.raises(OSError, match='sheet-1.json'):
+            excel(5)
+        # a ValueError of a worker tell its sheet
+        excel = ProcessExcel(get_data_path('test_excel_process.xlsx'), str(tmp_path), workers=2,
+                             output_format='ndjson', name_sheets={'Sheet2': {'header1': '_row'}, 'Sheet3': None})
+        with pytest.raises(ValueError, match='sheet Sheet2: '):
+            excel(5)
+
+
+def test_excel_process_date_mode_in_threads(tmp_path):
+    day = datetime.date(2016, 11, 16)
+    rows = [['time', 'header']] + [[day, 'content{}'.format(i)] for i in range(200)]
+    for date1904 in (False, True):
+        (tmp_path / str(date1904)).mkdir()
+        write_xlsx(str(tmp_path / '{}.xlsx'.format(date1904)), [('Sheet1', rows)], date1904=date1904)
+
+    def convert(date1904):
+        for _ in range(10):
+            ProcessExcel(str(tmp_path / '{}.xlsx'.format(date1904)), str(tmp_path / str(date1904)),
+                         show_row=False)(1000)
+
+    threads = [threading.Thread(target=convert, args=(date1904,)) for date1904 in (False, True)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    for date1904 in (False, True):
+        with open(str(tmp_path / str(date1904) / 'sheet-0.json'), encoding='utf-8') as f:
+            assert set(row['time'] for row in json.load(f)) == {'2016/11/16'}
+
+
+def _sheet_outcome(sheet):
+    try:
+        return list(_SheetProcess(sheet, merge_cell=False)())
+    except ValueError as e:
+        return str(e)
+
+
+@pytest.mark.parametrize('name', sorted(name for name in os.listdir(get_data_path('.')) if name.endswith('.xlsx')))
+def test_stream_reader_same_as_xlrd(name):
+    xlrd_book = get_sheets(get_data_path(name))
+    stream_book = get_sheets(get_data_path(name), reader='stream')
+    assert stream_book.names == xlrd_book.names
+    for index in range(len(xlrd_book)):
+        assert _sheet_outcome(stream_book[index]) == _sheet_outcome(xlrd_book[index])
+
+
+def test_excel_process_with_stream_reader(tmp_path):
+    for reader in ('xlrd', 'stream'):
+        (tmp_path / reader).mkdir()
+        ProcessExcel(get_data_path('test_excel_process.xlsx'), str(tmp_path / reader), reader=reader)(5)
+    names = sorted(os.listdir(str(tmp_path / 'xlrd')))
+    assert names == sorted(os.listdir(str(tmp_path / 'stream')))
+    for name in names:
+        assert (tmp_path / 'xlrd' / name).read_bytes() == (tmp_path / 'stream' / name).read_bytes()
+
+
+def _legacy_merge_rows(sheet_process):
+    """merge cell rows before the fill stage, each row fill from a copy of the last row dict"""
+    content_bak = {}
+    for row_index in range(sheet_process.start_row+1, sheet_process.sheet.nrows):
+        content = sheet_process.row_process(row_index)
+        if not content:
+            continue
+        for key in sheet_process.headers:
+            if not content[key]:
+                content[key] = content_bak.get(key, '')
+        content_bak = content.copy()
+        yield row_index+1, content
+
+
+@pytest.mark.parametrize('name', sorted(name for name in os.listdir(get_data_path('.')) if name.endswith('.xlsx')))
+def test_merge_fill_same_as_legacy(name):
+    for sheet in get_sheets(get_data_path(name)):
+        try:
+            sheet_process = _SheetProcess(sheet)
+            expected = list(_legacy_merge_rows(sheet_process))
+        except ValueError:
+            continue
+        assert list(sheet_process()) == expected
+
+
+def test_merge_fill_synthetic_same_as_legacy():
+    sheet_process = _SheetProcess(make_sheet(300, 5, date_ratio=0.4, blank_ratio=0.5, seed=2))
+    assert list(sheet_process()) == list(_legacy_merge_rows(sheet_process))
+
+
+def _write_merged_xlsx(path):
+    rows = [
+        ['left', 'a', 'b', 'c'],
+        ['l1', 'a1', 'b1', 'c1'],
+        ['l2', None, None, 'c2'],
+        ['l3', None, None, None],
+        [None, 'a4', 'b4', None],
+        [None, None, None, 'c5'],
+    ]
+    # a1:b3 merged, left column merged over rows 4-5 starting left of nothing, c4 blank not merged
+    write_xlsx(path, [('Sheet1', rows, [(1, 3, 1, 2), (3, 5, 0, 0)])])
+
+
+def test_merge_fill_merged_ranges(tmp_path):
+    path = str(tmp_path / 'merged.xlsx')
+    _write_merged_xlsx(path)
+    sheet = get_sheets(path)[0]
+    assert sorted(sheet.merged_cells) == [(1, 4, 1, 3), (3, 6, 0, 1)]
+    assert list(_SheetProcess(sheet)()) == [
+        (2, {'left': 'l1', 'a': 'a1', 'b': 'b1', 'c': 'c1'}),
+        (3, {'left': 'l2', 'a': 'a1', 'b': 'a1', 'c': 'c2'}),
+        (4, {'left': 'l3', 'a': 'a1', 'b': 'a1', 'c': ''}),
+        (5, {'left': 'l3', 'a': 'a4', 'b': 'b4', 'c': ''}),
+        (6, {'left': 'l3', 'a': '', 'b': '', 'c': 'c5'}),
+    ]
+
+    stream_sheet = get_sheets(path, reader='stream')[0]
+    assert sorted(stream_sheet.merged_cells) == sorted(sheet.merged_cells)
+    assert list(_SheetProcess(stream_sheet)()) == list(_SheetProcess(sheet)())
+
+
+def test_header_locator():
+    sheet = make_sheet(3, 4, top=600, left=1200)
+    # the defaults scan 500 rows and the header should start before column 1000
+    with pytest.raises(ValueError, match='scan 500 rows'):
+        _SheetProcess(sheet)
+    with pytest.raises(ValueError, match='scan 1000 columns'):
+        _SheetProcess(sheet, scan_rows=None)
+    sheet_process = _SheetProcess(sheet, scan_rows=1000, scan_cols=None)
+    assert (sheet_process.start_row, sheet_process.start_col) == (600, 1200)
+    assert sheet_process.headers == ['header0', 'header1', 'header2', 'header3']
+    assert [row for row, _ in sheet_process()] == [602, 603, 604]
+
+    # found once for each sheet
+    sheet.row_len = None
+    assert _HeaderLocator(sheet, 1000, None)() == (600, 1200)
+
+    with pytest.raises(ValueError, match='exist empty sheet'):
+        _SheetProcess(make_sheet(0, 0, top=10, left=3))
+
+
+def test_header_locator_not_string_cells(tmp_path):
+    path = str(tmp_path / 'numbers.xlsx')
+    rows = [[None, None, None], [None, 2016, 'name'], [None, 1, 'a'], [None, 2, '  ']]
+    write_xlsx(path, [('Sheet1', rows)])
+    for reader in ('xlrd', 'stream'):
+        sheet_process = _SheetProcess(get_sheets(path, reader=reader)[0], merge_cell=False)
+        assert (sheet_process.start_row, sheet_process.start_col) == (1, 1)
+        assert sheet_process.headers == ['2016.0', 'name']
+        assert list(sheet_process()) == [(3, {'2016.0': '1.0', 'name': 'a'}), (4, {'2016.0': '2.0', 'name': ''})]
+
+
+def test_excel_process_from_contents_to_stdout(capsysbinary, tmp_path):
+    path = get_data_path('test_excel_process.xlsx')
+    with open(path, 'rb') as f:
+        contents = f.read()
+
+    ProcessExcel(path, str(tmp_path), show_row=False)(1000)
+    ProcessExcel('-', '-', show_row=False, index_sheets={2: None}, patch_sheet_alias=False,
+                 file_contents=contents)(5)
+    with open(str(tmp_path / 'sheet-2.json'), encoding='utf-8') as f:
+        assert json.loads(capsysbinary.readouterr().out.decode('utf-8')) == json.load(f)
+
+    ProcessExcel('-', '-', output_format='ndjson', file_contents=contents, workers=2)()
+    lines = capsysbinary.readouterr().out.decode('utf-8').splitlines()
+    assert len(lines) == sum(len(json.load(open(str(tmp_path / name), encoding='utf-8')))
+                             for name in os.listdir(str(tmp_path)) if not name.endswith('manifest.json'))
+    assert list(json.loads(lines[0]))[:2] == ['_sheet', '_row']
+    assert json.loads(lines[0])['_row'] == 2
+    # each line tell its sheet apart
+    sheets = {}
+    for line in lines:
+        data = json.loads(line)
+        sheets.setdefault(data.pop('_sheet'), []).append(data)
+    with open(str(tmp_path / 'sheet-2.json'), encoding='utf-8') as f:
+        assert [{key: value for key, value in data.items() if key != '_row'} for data in sheets['Sheet3']] == \
+            json.load(f)
+    assert not any(name.endswith('json') for name in os.listdir(get_data_path('.')))
+
+    # a single sheet has no sheet name field
+    ProcessExcel('-', '-', output_format='ndjson', index_sheets={2: None}, patch_sheet_alias=False,
+                 file_contents=contents)()
+    assert '_sheet' not in json.loads(capsysbinary.readouterr().out.decode('utf-8').splitlines()[0])
+
+    with pytest.raises(ValueError, match='single sheet'):
+        ProcessExcel('-', '-', file_contents=contents)
+    with pytest.raises(ValueError, match='row number'):
+        ProcessExcel('-', '-', output_format='ndjson', show_row=False, file_contents=contents)
+
+
+def test_console_stdout_closed_early(tmp_path):
+    import subprocess
+
+    path = str(tmp_path / 'book.xlsx')
+    rows, merged = make_rows(20000, 5)
+    write_xlsx(path, [('Sheet1', rows, merged)])
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    code = 'import sys; sys.argv[0] = "excel2json"; from exceltojson.console import main; main()'
+    # like `excel2json -s book.xlsx -o - -f ndjson | head -1`
+    process = subprocess.Popen([sys.executable, '-c', code, '-s', path, '-o', '-', '-f', 'ndjson'], cwd=root,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    assert json.loads(process.stdout.readline().decode('utf-8'))['_row'] == 2
+    process.stdout.close()
+    err = process.stderr.read().decode('utf-8')
+    process.wait()
+    assert 'Error' not in err
+    assert process.returncode == 1
+
+
+def test_excel_process_incremental(tmp_path):
+    path = str(tmp_path / 'book.xlsx')
+    out = tmp_path / 'out'
+    out.mkdir()
+    rows = [['header'], ['content']]
+    write_xlsx(path, [('Sheet1', rows), ('Sheet2', rows)])
+
+    def convert(**kwargs):
+        report = ProcessExcel(path, str(out), incremental=True, **kwargs)()
+        return {'converted': report['converted'], 'skipped': report['skipped']}
+
+    assert convert() == {'converted': [0, 1], 'skipped': []}
+    assert convert() == {'converted': [], 'skipped': [0, 1]}
+    report = ProcessExcel(path, str(out))()
+    assert report['rows'] == 2
+    assert report['bytes'] == os.path.getsize(str(out / 'sheet-0.json')) * 2
+    # options which change the json files
+    assert convert(show_row=False) == {'converted': [0, 1], 'skipped': []}
+    assert convert(show_row=False, workers=2) == {'converted': [], 'skipped': [0, 1]}
+
+    # a changed sheet, numbers are in the sheet xml, strings are shared by all sheets
+    write_xlsx(path, [('Sheet1', rows), ('Sheet2', rows + [[2]])])
+    assert convert(show_row=False, workers=2) == {'converted': [1], 'skipped': [0]}
+    with open(str(out / 'sheet-1.json'), encoding='utf-8') as f:
+        assert json.load(f) == [{'header': 'content'}, {'header': '2.0'}]
+    write_xlsx(path, [('Sheet1', rows), ('Sheet2', rows + [['new']])])
+    assert convert(show_row=False) == {'converted': [0, 1], 'skipped': []}
+
+    # a missing json file
+    os.remove(str(out / 'sheet-0.json'))
+    assert convert(show_row=False) == {'converted': [0], 'skipped': [1]}
+
+
+@pytest.mark.parametrize('engine', ['row', 'numpy'])
+def test_excel_process_stats(tmp_path, engine):
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+    path = str(tmp_path / 'book.xlsx')
+    rows = [['header', 'day'], ['a', datetime.date(2020, 1, 2)], ['b', None], ['c', datetime.date(2020, 1, 3)]]
+    write_xlsx(path, [('Sheet1', rows), ('Sheet2', rows[:2])])
+
+    report = ProcessExcel(path, str(tmp_path))(2)
+    assert report['stats'] is None
+
+    report = ProcessExcel(path, str(tmp_path), engine=engine, stats=True)(2)
+    stats = report['stats']
+    assert sorted(stats.sheets) == [0, 1]
+    sheet = stats.sheets[0]
+    assert (sheet.rows, sheet.cells, sheet.chunks, sheet.date_cells) == (3, 6, 2, 2)
+    assert sheet.bytes == sum(os.path.getsize(str(tmp_path / name))
+                              for name in ('sheet-0.json', 'sheet-0.part00001.json'))
+    assert (stats.sheets[1].rows, stats.sheets[1].date_cells) == (1, 1)
+    assert set(sheet.times) == set(sheet.STAGES)
+    assert 0 <= sum(sheet.times.values()) <= sheet.total
+    assert len(stats.format().splitlines()) == 4
+
+    parallel = ProcessExcel(path, str(tmp_path), engine=engine, stats=True, workers=2)(2)['stats']
+    assert {name: (s.rows, s.bytes) for name, s in parallel.sheets.items()} == \
+        {name: (s.rows, s.bytes) for name, s in stats.sheets.items()}
+
+
+@pytest.mark.parametrize('reader', ['xlrd', 'stream'])
+def test_iter_rows(tmp_path, reader):
+    from exceltojson import headers, iter_rows
+
+    path = get_data_path('test_excel_process.xlsx')
+    ProcessExcel(path, str(tmp_path), index_sheets={2: {'header2': 'alias2'}}, patch_sheet_alias=False)(100)
+    with open(str(tmp_path / 'sheet-2.json'), encoding='utf-8') as f:
+        expected = json.load(f)
+
+    rows = iter_rows(path, 2, alias={'header2': 'alias2'}, reader=reader)
+    assert {str(row): data for row, data in rows} == expected
+    name = get_sheets(path).names[2]
+    tuples = list(iter_rows(path, name, alias={'header2': 'alias2'}, as_tuple=True, reader=reader))
+    header_row, keys = headers(path, name, alias={'header2': 'alias2'}, reader=reader)
+    assert 'alias2' in keys
+    # only the data rows are yielded
+    assert header_row < tuples[0][0]
+    assert {str(row): dict(zip(keys, data)) for row, data in tuples} == expected
+
+    with pytest.raises(ValueError):
+        next(iter_rows(path, 10))
+    with pytest.raises(ValueError):
+        next(iter_rows(path, 'no such sheet'))
+    with pytest.raises(ValueError):
+        headers(path, 10)
+
+
+def _output_files(path):
+    files = {}
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), 'rb') as f:
+            files[name] = f.read()
+    return files
+
+
+def test_excel_process_background_write(tmp_path, monkeypatch):
+    path = get_data_path('test_excel_process.xlsx')
+    serial = tmp_path / 'serial'
+    background = tmp_path / 'background'
+    serial.mkdir()
+    background.mkdir()
+    ProcessExcel(path, str(serial), incremental=True)(3)
+    synced = []
+    monkeypatch.setattr(os, 'fsync', synced.append)
+    report = ProcessExcel(path, str(background), incremental=True, background_write=True, fsync=True)(3)
+    assert _output_files(str(background)) == _output_files(str(serial))
+    assert not [name for name in os.listdir(str(background)) if name.endswith('.tmp')]
+    assert len(synced) == sum(name.startswith('sheet') and 'manifest' not in name
+                              for name in os.listdir(str(background)))
+    assert report['rows'] == sum(json.loads(data.decode('utf-8'))['rows']
+                                 for name, data in _output_files(str(background)).items()
+                                 if name.endswith('.manifest.json'))
+
+    # a failed write fail the conversion, the json file is not there half written
+    def fail(self, data):
+        raise IOError('disk full')
+
+    monkeypatch.setattr('exceltojson.excel2json._FileSink.write', fail)
+    with pytest.raises(IOError):
+        ProcessExcel(path, str(tmp_path), background_write=True)(3)
+    assert not os.path.exists(str(tmp_path / 'sheet-0.json'))
+    assert not os.path.exists(str(tmp_path / 'sheet-0.manifest.json'))
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.tmp')]
+
+
+@pytest.mark.parametrize('background_write', [False, True])
+def test_excel_process_error_keep_json_files(tmp_path, monkeypatch, background_write):
+    path = str(tmp_path / 'book.xlsx')
+    rows, merged = make_rows(50, 3)
+    write_xlsx(path, [('Sheet1', rows, merged)])
+    out = tmp_path / 'out'
+    out.mkdir()
+    ProcessExcel(path, str(out))(100)
+    expected = _output_files(str(out))
+
+    # a cell conversion error after 9 rows
+    texts = _RowProcess.texts
+    converted = []
+
+    def fail(self, values, types):
+        converted.append(1)
+        if len(converted) > 9:
+            raise ValueError('bad cell')
+        return texts(self, values, types)
+
+    monkeypatch.setattr(_RowProcess, 'texts', fail)
+    with pytest.raises(ValueError, match='sheet 0: bad cell'):
+        ProcessExcel(path, str(out), background_write=background_write)(100)
+    assert _output_files(str(out)) == expected
+
+
+def test_excel_process_background_write_keep_conversion_error(tmp_path, monkeypatch):
+    path = str(tmp_path / 'book.xlsx')
+    rows = [['header'], ['a'], ['b'], ['c']]
+    write_xlsx(path, [('Sheet1', rows), ('Sheet2', rows)])
+    # the writes of the first sheet fail once the second sheet failed to convert
+    converted = threading.Event()
+
+    def fail_write(self, data):
+        converted.wait(5)
+        raise IOError('disk full')
+
+    texts = _RowProcess.texts
+    calls = []
+
+    def fail_texts(self, values, types):
+        calls.append(1)
+        if len(calls) > 3:
+            converted.set()
+            raise ValueError('bad cell')
+        return texts(self, values, types)
+
+    monkeypatch.setattr('exceltojson.excel2json._FileSink.write', fail_write)
+    monkeypatch.setattr(_RowProcess, 'texts', fail_texts)
+    with pytest.raises(ValueError, match='sheet 1: bad cell'):
+        ProcessExcel(path, str(tmp_path), background_write=True)(100)
+    assert not [name for name in os.listdir(str(tmp_path)) if name.endswith('.json') or name.endswith('.tmp')]
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_excel_process_error_type(tmp_path, monkeypatch, workers):
+    # only the ValueError of a sheet is raised again with the sheet name, the others keep their type
+    def fail(self, data):
+        raise IOError('disk full')
+
+    monkeypatch.setattr('exceltojson.excel2json._FileSink.write', fail)
+    with pytest.raises(IOError, match='disk full'):
+        ProcessExcel(get_data_path('test_excel_process.xlsx'), str(tmp_path), workers=workers)(3)
+
+
+@pytest.mark.parametrize('merged_ratio', [0.0, 0.1])
+@pytest.mark.parametrize('fork', [True, False])
+def test_excel_process_range_rows(tmp_path, monkeypatch, merged_ratio, fork):
+    if not fork:
+        # the workers are spawned and open the workbook themselves
+        monkeypatch.setattr('exceltojson.excel2json._can_fork', lambda: False)
+    path = str(tmp_path / 'book.xlsx')
+    rows, merged = make_rows(300, 6, date_ratio=0.2, blank_ratio=0.2, merged_ratio=merged_ratio, seed=3)
+    # a column empty for many ranges, its cells take the value before those ranges
+    for row in rows[40:200]:
+        row[5] = None
+    write_xlsx(path, [('Sheet1', rows, merged), ('Sheet2', rows[:50])])
+
+    def convert(out, **kwargs):
+        os.mkdir(str(tmp_path / out))
+        ProcessExcel(path, str(tmp_path / out), **kwargs)(max_row=45)
+        return _output_files(str(tmp_path / out))
+
+    for n, options in enumerate([{}, dict(merge_cell=False), dict(show_row=False, output_format='ndjson'),
+                                 dict(background_write=True)]):
+        serial = convert('serial{}'.format(n), **options)
+        assert convert('ranges{}'.format(n), workers=2, range_rows=7, **options) == serial
+
+    # the workers count and time their ranges
+    serial = ProcessExcel(path, str(tmp_path / 'serial0'), stats=True)(45)['stats'].sheets[0]
+    ranges = ProcessExcel(path, str(tmp_path / 'ranges0'), workers=2, range_rows=7, stats=True)(45)['stats'].sheets[0]
+    assert (ranges.rows, ranges.date_cells) == (serial.rows, serial.date_cells)
+    assert ranges.date_cells > 0
+    assert ranges.times['read'] > 0 and ranges.times['convert'] > 0 and ranges.times['merge_fill'] > 0
+    with pytest.raises(ValueError):
+        ProcessExcel(path, str(tmp_path), range_rows=0)
+
+
+def test_can_fork():
+    import multiprocessing
+
+    if sys.platform == 'darwin' or 'fork' not in multiprocessing.get_all_start_methods():
+        assert not _can_fork()
+        return
+    # the thread pools of the other tests may still be there
+    assert _can_fork() == (threading.active_count() == 1)
+    # not while another thread is running, e.g. the writer thread
+    stop = threading.Event()
+    thread = threading.Thread(target=stop.wait)
+    thread.start()
+    try:
+        assert not _can_fork()
+    finally:
+        stop.set()
+        thread.join()
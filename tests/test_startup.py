@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""the command line should start without the conversion modules, they are imported
+when a conversion start
+"""
+from __future__ import unicode_literals
+
+import os
+import subprocess
+import sys
+
+# exceltojson.console import time in microseconds, it took about 130ms when it imported
+# the conversion modules and about 20ms without them
+IMPORT_TIME_LIMIT = 60000
+
+HEAVY_MODULES = ('xlrd', 'six', 'json', 'concurrent.futures', 'exceltojson.excel2json', 'exceltojson.utils')
+
+
+def _import_times(code):
+    """run code with -X importtime
+    :return: {module: cumulative import time in microseconds}
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen([sys.executable, '-X', 'importtime', '-c', code], cwd=root,
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    _, err = process.communicate()
+    times = {}
+    for line in err.decode('utf-8').splitlines():
+        if line.startswith('import time:') and '|' in line:
+            _, cumulative, module = line.split('|')
+            if cumulative.strip().isdigit():
+                times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_help_does_not_import_conversion_modules():
+    times = _import_times("import sys; sys.argv = ['excel2json', '-h']\n"
+                          "from exceltojson.console import main\n"
+                          "try:\n    main()\nexcept SystemExit:\n    pass")
+    assert 'exceltojson.console' in times
+    assert [module for module in HEAVY_MODULES if module in times] == []
+
+
+def test_console_import_time():
+    best = min(_import_times('import exceltojson.console')['exceltojson.console'] for _ in range(3))
+    assert best < IMPORT_TIME_LIMIT
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""end to end throughput of ProcessExcel on generated workbooks, compared with the
+saved baseline tests/benchmark_baseline.json
+
+    py.test tests/test_throughput.py --benchmark -s       # compare with the baseline
+    py.test tests/test_throughput.py --benchmark-save -s  # save a new baseline
+
+the baseline is machine dependent, save it again on the machine which run the
+benchmarks before comparing
+"""
+from __future__ import unicode_literals, print_function
+
+import json
+import os
+import time
+import tracemalloc
+
+import pytest
+
+from exceltojson.excel2json import ProcessExcel
+from exceltojson.stats import SheetStats
+from tests.synthetic import make_rows, write_xlsx
+
+pytestmark = pytest.mark.benchmark
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'benchmark_baseline.json')
+
+# a case fail if its rows/s drop under this part of the baseline
+MIN_SPEED = 0.5
+# or its peak memory grow over this many times of the baseline
+MAX_MEMORY = 1.5
+
+# name: (make_rows arguments, ProcessExcel arguments)
+CASES = {
+    'plain-20000x20': (dict(rows=20000, cols=20), {}),
+    'dates-20000x20': (dict(rows=20000, cols=20, date_ratio=0.3), {}),
+    'blank-20000x20': (dict(rows=20000, cols=20, blank_ratio=0.2), {}),
+    'merged-20000x20': (dict(rows=20000, cols=20, merged_ratio=0.05), {}),
+    'wide-2000x200': (dict(rows=2000, cols=200, date_ratio=0.1, blank_ratio=0.05, merged_ratio=0.05), {}),
+    'stream-20000x20': (dict(rows=20000, cols=20, date_ratio=0.1, merged_ratio=0.05), dict(reader='stream')),
+}
+
+
+@pytest.fixture(scope='module')
+def baseline(request):
+    """ the saved results, the results of this run are saved at the end with --benchmark-save
+    """
+    saved = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            saved = json.load(f)
+    results = {}
+    yield saved, results
+    if request.config.getoption('--benchmark-save'):
+        with open(BASELINE, 'w') as f:
+            f.write(json.dumps(dict(saved, **results), indent=2, sort_keys=True))
+
+
+def _convert(path, save_path, **kwargs):
+    return ProcessExcel(path, save_path, **kwargs)(max_row=100000)
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_throughput(tmp_path, baseline, name):
+    path = str(tmp_path / 'book.xlsx')
+    row_options, options = CASES[name]
+    rows, merged = make_rows(seed=0, **row_options)
+    write_xlsx(path, [('Sheet1', rows, merged)])
+    out = str(tmp_path)
+
+    start = time.time()
+    report = _convert(path, out, **options)
+    seconds = time.time() - start
+    stages = _convert(path, out, stats=True, **options)['stats']
+    tracemalloc.start()
+    try:
+        _convert(path, out, **options)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'rows_per_s': report['rows'] / seconds,
+        'mb_per_s': report['bytes'] / seconds / 1e6,
+        'peak_mb': peak / 1e6,
+        'stages': stages.sheets[0].times,
+    }
+    print('\n{}: {:.0f} rows/s, {:.1f} MB/s json, peak {:.1f} MB, open {:.3f}s'.format(
+        name, result['rows_per_s'], result['mb_per_s'], result['peak_mb'], stages.open))
+    print('  ' + ', '.join('{} {:.3f}s'.format(stage, result['stages'][stage]) for stage in SheetStats.STAGES))
+
+    saved, results = baseline
+    results[name] = result
+    if name not in saved:
+        return
+    old = saved[name]
+    print('  baseline: {:.0f} rows/s, peak {:.1f} MB'.format(old['rows_per_s'], old['peak_mb']))
+    assert result['rows_per_s'] >= old['rows_per_s'] * MIN_SPEED
+    assert result['peak_mb'] <= old['peak_mb'] * MAX_MEMORY
@@ -1,7 +1,12 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from exceltojson.utils import get_sheet_names, get_data_path
+import os
+import shutil
+
+import xlrd
+
+from exceltojson.utils import Workbook, WorkbookCache, get_sheets, get_sheet_names, get_data_path
 
 
 def test_get_sheet_names():
@@ -11,3 +16,50 @@ def test_get_sheet_names():
     assert set(sheet_dict.keys()) == {u'名字', 'Sheet2', 'Sheet3'}
 
 
+
+
+def test_workbook_load_sheet_on_demand():
+    book = Workbook(get_data_path('test_get_sheet_names.xlsx'))
+    assert len(book) == 3
+    assert book.names == [u'名字', 'Sheet2', 'Sheet3']
+    assert not any(book.sheet_loaded(i) for i in range(3))
+
+    sheet = book.sheet_by_name('Sheet2')
+    assert sheet.name == 'Sheet2'
+    assert book.sheet_loaded(1)
+    assert not book.sheet_loaded(0) and not book.sheet_loaded(2)
+
+    book.unload_sheet('Sheet2')
+    assert not book.sheet_loaded(1)
+    # unloaded sheet is parsed again when asked for
+    assert book[1].nrows == sheet.nrows
+    book.release_resources()
+
+
+def test_workbook_same_content_as_xlrd():
+    path = get_data_path('test_excel_process.xlsx')
+    expected = xlrd.open_workbook(path)
+    book = Workbook(path)
+    assert book.datemode == expected.datemode
+    for index, sheet in enumerate(expected.sheets()):
+        lazy_sheet = book[index]
+        assert (lazy_sheet.nrows, lazy_sheet.ncols) == (sheet.nrows, sheet.ncols)
+        for row in range(sheet.nrows):
+            assert lazy_sheet.row_values(row) == sheet.row_values(row)
+            assert lazy_sheet.row_types(row) == sheet.row_types(row)
+
+
+def test_workbook_cache(tmp_path):
+    path = str(tmp_path / 'book.xlsx')
+    shutil.copy(get_data_path('test_get_sheet_names.xlsx'), path)
+    cache = WorkbookCache()
+    book = get_sheets(path, cache)
+    assert get_sheets(path, cache) is book
+    # sheets by name and by index come from the same parse
+    assert get_sheet_names(path, cache)[u'名字'] is book[0]
+
+    # changed file is opened again
+    stat = os.stat(path)
+    os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+    assert get_sheets(path, cache) is not book
+    cache.clear()